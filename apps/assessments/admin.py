@@ -20,7 +20,13 @@ class QuestionAdmin(admin.ModelAdmin):
 
 @admin.register(Assessment)
 class AssessmentAdmin(admin.ModelAdmin):
-    readonly_fields = ("user_difficulty_rating", "average_score", "attempts_count")
+    readonly_fields = (
+        "user_difficulty_rating",
+        "average_score",
+        "score_sum",
+        "scored_attempts_count",
+        "attempts_count",
+    )
 
 
 admin.site.register(AssessmentDifficultyRating)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.assessments.services import rebuild_assessment_analytics
+
+
+class Command(BaseCommand):
+    help = "Recompute the assessment analytics summary tables from the attempt history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("assessment_ids", nargs="*", type=int, help="Only rebuild these assessments.")
+
+    def handle(self, *args, **options):
+        rebuild_assessment_analytics(options["assessment_ids"] or None)
+        self.stdout.write(self.style.SUCCESS("Assessment analytics rebuilt."))
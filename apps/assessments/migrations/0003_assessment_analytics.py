@@ -0,0 +1,51 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0002_assessment_score_accumulators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceStats',
+            fields=[
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='assessments.choice')),
+                ('picks_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Choice stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='assessments.question')),
+                ('answers_count', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_squares_sum', models.FloatField(default=0)),
+                ('correct_score_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Question stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='AssessmentDurationBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.PositiveIntegerField()),
+                ('attempts_count', models.PositiveIntegerField(default=0)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duration_buckets', to='assessments.assessment')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='assessmentdurationbucket',
+            constraint=models.UniqueConstraint(fields=('assessment', 'minute'), name='uq_duration_bucket_assessment_minute'),
+        ),
+    ]
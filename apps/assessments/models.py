@@ -1,10 +1,13 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from apps.base.models import Topic
 from apps.spaces.models import Space
 from apps.users.models import CustomUser
+from apps.assessments.services import invalidate_question_pool
 
 
 def validate_file_size(value, max_size):
@@ -60,17 +63,27 @@ class Assessment(models.Model):
     difficulty = models.FloatField(default=5.0, validators=[MinValueValidator(1.0), MaxValueValidator(10.0)])
     user_difficulty_rating = models.FloatField(null=True, blank=True)
     average_score = models.FloatField(null=True, blank=True)
+    score_sum = models.FloatField(default=0)  # running sum/count of finished attempt scores
+    scored_attempts_count = models.PositiveIntegerField(default=0)
     attempts_count = models.IntegerField(default=0)
 
-    def get_available_attempts(self, user):
+    def get_available_attempts(self, user, attempts_used=None, has_perfect=None):
+        """
+        Attempts `user` has left. Pass `attempts_used` and `has_perfect` when they are already
+        known (e.g. annotated by `with_viewer_state`) to skip the attempt queries.
+        """
         if not user.is_authenticated:
             return 0
-        if self.user == user:
+        if self.user_id == user.id:
             return 0
         attempts = self.attempts.filter(user=user)
-        if attempts.filter(score=100).exists():
+        if has_perfect is None:
+            has_perfect = attempts.filter(score=100).exists()
+        if has_perfect:
             return 0
-        return self.allowed_attempts - attempts.count()
+        if attempts_used is None:
+            attempts_used = attempts.count()
+        return self.allowed_attempts - attempts_used
 
     def __str__(self):
         return self.name
@@ -122,6 +135,20 @@ class Choice(models.Model):
         return self.description[:50] + "..." if len(self.description) > 50 else self.description
 
 
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_pool_on_question_change(sender, instance, **kwargs):
+    invalidate_question_pool(instance.assessment_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_question_pool_on_choice_change(sender, instance, **kwargs):
+    question = Question.objects.filter(pk=instance.question_id).values("assessment_id").first()
+    if question:
+        invalidate_question_pool(question["assessment_id"])
+
+
 class AssessmentDifficultyRating(models.Model):
     assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name="difficulty_ratings")
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="difficulty_ratings")
@@ -153,3 +180,50 @@ class FollowAssessment(models.Model):
 
     def __str__(self):
         return f"{self.follower} -> {self.assessment}"
+
+
+class QuestionStats(models.Model):
+    """
+    Running answer statistics of a question, kept up to date on every finalization. The score
+    sums are the sufficient statistics of the point-biserial discrimination index.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    answers_count = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)  # attempt scores of everyone who answered
+    score_squares_sum = models.FloatField(default=0)
+    correct_score_sum = models.FloatField(default=0)  # attempt scores of those who answered right
+
+    class Meta:
+        verbose_name_plural = "Question stats"
+
+    def __str__(self):
+        return f"{self.question} - {self.correct_count}/{self.answers_count}"
+
+
+class ChoiceStats(models.Model):
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    picks_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Choice stats"
+
+    def __str__(self):
+        return f"{self.choice} - {self.picks_count} picks"
+
+
+class AssessmentDurationBucket(models.Model):
+    """Finished attempts of an assessment by whole minutes taken, for time-to-finish percentiles."""
+
+    assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name="duration_buckets")
+    minute = models.PositiveIntegerField()
+    attempts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["assessment", "minute"], name="uq_duration_bucket_assessment_minute"),
+        ]
+
+    def __str__(self):
+        return f"{self.assessment} - {self.minute} min: {self.attempts_count}"
@@ -15,7 +15,7 @@ class AssessmentPermissions(permissions.BasePermission):
         if request.method == "POST":
             if not request.user.is_authenticated:
                 return False
-            if view.action in ("create", "create_full"):
+            if view.action in ("create", "create_full", "import_assessment"):
                 user_level, _ = get_user_level(request.user)
                 return (
                     user_level >= self.creator_required_level
@@ -26,6 +26,8 @@ class AssessmentPermissions(permissions.BasePermission):
         return request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
+        if view.action in ("analytics", "export_assessment"):
+            return obj.user == request.user
         if request.method in permissions.SAFE_METHODS:
             return True
 
@@ -0,0 +1,454 @@
+import json
+import math
+import random
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+
+QUESTION_POOL_CACHE_TIMEOUT = 60 * 60  # 1 hour; invalidated early on question/choice edits
+
+
+def question_pool_cache_key(assessment_id):
+    return f"assessments:question_pool:{assessment_id}"
+
+
+def choice_rules_error(is_multiple_choice, total_choices, correct_choices):
+    if is_multiple_choice:
+        if total_choices < 3:
+            return "The question should have at least 3 choices."
+        if correct_choices < 2:
+            return "The question should have at least 2 correct choices."
+    else:
+        if total_choices < 2:
+            return "The question should have at least 2 choices."
+        if correct_choices != 1:
+            return "The question should have only 1 correct choice."
+    return None
+
+
+def with_viewer_state(assessments, user, followers_count=False):
+    """
+    Annotate what the assessment serializers need about `user`, as correlated subqueries, so a
+    page of assessments costs a fixed number of queries: `is_approved`, `has_perfect`,
+    `attempts_used` and `follow_id`. Pass `followers_count=True` to also annotate the active
+    followers count, which only the detail serializer reads.
+    """
+    from apps.assessments.models import FollowAssessment
+    from apps.attempts.models import Attempt
+
+    def count_of(queryset):
+        counted = queryset.order_by().values("assessment").annotate(count=Count("pk")).values("count")
+        return Coalesce(Subquery(counted), 0)
+
+    if followers_count:
+        followers = FollowAssessment.objects.filter(assessment=OuterRef("pk"), follower__is_active=True)
+        assessments = assessments.annotate(followers_count=count_of(followers))
+    if not user.is_authenticated:
+        return assessments
+
+    own_attempts = Attempt.objects.filter(assessment=OuterRef("pk"), user=user)
+    follow = FollowAssessment.objects.filter(assessment=OuterRef("pk"), follower=user)
+    return assessments.annotate(
+        is_approved=Exists(own_attempts.filter(approved=True)),
+        has_perfect=Exists(own_attempts.filter(score=100)),
+        attempts_used=count_of(own_attempts),
+        follow_id=Subquery(follow.values("pk")[:1]),
+    )
+
+
+def get_question_pool(assessment_id):
+    """
+    Active questions of an assessment with their choices, as the plain payload sent to the
+    attempt taker (no correct answers). Built with two queries and cached until a question or
+    choice of the assessment changes.
+    """
+    from apps.assessments.models import Question, Choice
+
+    def compute():
+        questions = (
+            Question.objects.filter(assessment_id=assessment_id, is_active=True)
+            .order_by("id")
+            .prefetch_related(Prefetch("choices", queryset=Choice.objects.order_by("id")))
+        )
+        return [
+            {
+                "question_id": q.id,
+                "description": q.description,
+                "is_multiple_choice": q.is_multiple_choice,
+                "choices": [{"choice_id": c.id, "description": c.description} for c in q.choices.all()],
+            }
+            for q in questions
+        ]
+
+    return cache.get_or_set(question_pool_cache_key(assessment_id), compute, QUESTION_POOL_CACHE_TIMEOUT)
+
+
+def invalidate_question_pool(assessment_id):
+    cache.delete(question_pool_cache_key(assessment_id))
+
+
+def sample_questions(pool, number_of_questions, seed):
+    """
+    Pick `number_of_questions` questions from `pool` and shuffle their choices. The same seed
+    always yields the same paper for the same pool.
+    """
+    rng = random.Random(seed)
+    questions = rng.sample(pool, min(number_of_questions, len(pool)))
+    return [{**q, "choices": rng.sample(q["choices"], len(q["choices"]))} for q in questions]
+
+
+def record_attempt_analytics(attempt, question_attempts, selected_choice_ids):
+    """
+    Fold a finalized attempt into the analytics summary tables: its graded answers, the
+    choices picked for each (`selected_choice_ids`, parallel to `question_attempts`) and the
+    minutes it took. A fixed handful of queries whatever the attempt size. The summary rows
+    are locked in id order, so concurrent attempts of one assessment cannot deadlock.
+    """
+    from apps.assessments.models import AssessmentDurationBucket, ChoiceStats, QuestionStats
+
+    score = attempt.score
+    question_ids = sorted(qa.question_id for qa in question_attempts)
+    correct_ids = sorted(qa.question_id for qa in question_attempts if qa.is_correct)
+    choice_ids = sorted(set().union(*selected_choice_ids))
+    minute = duration_minute(attempt.start_time, attempt.end_time, attempt.assessment.time_limit)
+
+    with transaction.atomic():
+        if question_ids:
+            QuestionStats.objects.bulk_create(
+                [QuestionStats(question_id=q) for q in question_ids], ignore_conflicts=True
+            )
+            question_stats = QuestionStats.objects.filter(question_id__in=question_ids)
+            list(question_stats.select_for_update().order_by("question_id").values_list("pk", flat=True))
+            question_stats.update(
+                answers_count=F("answers_count") + 1,
+                score_sum=F("score_sum") + score,
+                score_squares_sum=F("score_squares_sum") + score * score,
+            )
+        if correct_ids:
+            QuestionStats.objects.filter(question_id__in=correct_ids).update(
+                correct_count=F("correct_count") + 1, correct_score_sum=F("correct_score_sum") + score
+            )
+
+        if choice_ids:
+            ChoiceStats.objects.bulk_create([ChoiceStats(choice_id=c) for c in choice_ids], ignore_conflicts=True)
+            choice_stats = ChoiceStats.objects.filter(choice_id__in=choice_ids)
+            list(choice_stats.select_for_update().order_by("choice_id").values_list("pk", flat=True))
+            choice_stats.update(picks_count=F("picks_count") + 1)
+
+        AssessmentDurationBucket.objects.bulk_create(
+            [AssessmentDurationBucket(assessment_id=attempt.assessment_id, minute=minute)], ignore_conflicts=True
+        )
+        AssessmentDurationBucket.objects.filter(assessment_id=attempt.assessment_id, minute=minute).update(
+            attempts_count=F("attempts_count") + 1
+        )
+
+
+def duration_minute(start_time, end_time, time_limit):
+    """Whole minutes an attempt took, capped at the time limit for attempts closed by expiry."""
+    return min(int((end_time - start_time).total_seconds() // 60), time_limit)
+
+
+def rebuild_assessment_analytics(assessment_ids=None):
+    """
+    Recompute the analytics summary tables from QuestionAttempt history, for every assessment
+    or only `assessment_ids`. Heavy; meant for backfills and repairs, not request paths.
+    """
+    from apps.assessments.models import AssessmentDurationBucket, Choice, ChoiceStats, Question, QuestionStats
+    from apps.attempts.models import Attempt, QuestionAttempt
+
+    question_attempts = QuestionAttempt.objects.filter(attempt__is_finished=True)
+    picks = QuestionAttempt.selected_choices.through.objects.filter(questionattempt__attempt__is_finished=True)
+    attempts = Attempt.objects.filter(is_finished=True, end_time__isnull=False)
+    questions, choices = Question.objects.all(), Choice.objects.all()
+    buckets = AssessmentDurationBucket.objects.all()
+    if assessment_ids is not None:
+        question_attempts = question_attempts.filter(question__assessment_id__in=assessment_ids)
+        picks = picks.filter(choice__question__assessment_id__in=assessment_ids)
+        attempts = attempts.filter(assessment_id__in=assessment_ids)
+        questions = questions.filter(assessment_id__in=assessment_ids)
+        choices = choices.filter(question__assessment_id__in=assessment_ids)
+        buckets = buckets.filter(assessment_id__in=assessment_ids)
+
+    correct = Q(is_correct=True)
+    question_rows = question_attempts.values("question_id").annotate(
+        answers_count=Count("id"),
+        correct_count=Count("id", filter=correct),
+        score_sum=Sum("attempt__score"),
+        score_squares_sum=Sum(F("attempt__score") * F("attempt__score")),
+        correct_score_sum=Coalesce(Sum("attempt__score", filter=correct), 0.0),
+    )
+    choice_rows = picks.values("choice_id").annotate(picks_count=Count("id"))
+    durations = Counter(
+        (assessment_id, duration_minute(start_time, end_time, time_limit))
+        for assessment_id, start_time, end_time, time_limit in attempts.values_list(
+            "assessment_id", "start_time", "end_time", "assessment__time_limit"
+        ).iterator()
+    )
+
+    with transaction.atomic():
+        QuestionStats.objects.filter(question__in=questions).delete()
+        ChoiceStats.objects.filter(choice__in=choices).delete()
+        buckets.delete()
+        QuestionStats.objects.bulk_create((QuestionStats(**row) for row in question_rows), batch_size=1000)
+        ChoiceStats.objects.bulk_create((ChoiceStats(**row) for row in choice_rows), batch_size=1000)
+        AssessmentDurationBucket.objects.bulk_create(
+            (
+                AssessmentDurationBucket(assessment_id=assessment_id, minute=minute, attempts_count=count)
+                for (assessment_id, minute), count in durations.items()
+            ),
+            batch_size=1000,
+        )
+
+
+def discrimination_index(stats):
+    """
+    Point-biserial correlation between answering the question right and the attempt score,
+    from the running sums. None until both right and wrong answers exist.
+    """
+    n, c = stats.answers_count, stats.correct_count
+    if n < 2 or c in (0, n):
+        return None
+    mean = stats.score_sum / n
+    variance = stats.score_squares_sum / n - mean * mean
+    if variance <= 0:
+        return None
+    mean_correct = stats.correct_score_sum / c
+    mean_wrong = (stats.score_sum - stats.correct_score_sum) / (n - c)
+    p = c / n
+    return round((mean_correct - mean_wrong) / math.sqrt(variance) * math.sqrt(p * (1 - p)), 3)
+
+
+def duration_percentiles(buckets, percentiles=(50, 75, 90)):
+    """Minutes within which each percentile of attempts finished, from (minute, count) buckets."""
+    total = sum(count for _, count in buckets)
+    result = {}
+    for percentile in percentiles:
+        if not total:
+            result[f"p{percentile}"] = None
+            continue
+        threshold, seen = total * percentile / 100, 0
+        for minute, count in buckets:
+            seen += count
+            if seen >= threshold:
+                result[f"p{percentile}"] = minute + 1
+                break
+    return result
+
+
+def _choice_analytics(choice, answers_count):
+    stats = getattr(choice, "stats", None)
+    picks = stats.picks_count if stats else 0
+    return {
+        "choice_id": choice.id,
+        "description": choice.description,
+        "correct_answer": choice.correct_answer,
+        "picks_count": picks,
+        "pick_rate": round(picks / answers_count, 3) if answers_count else None,
+    }
+
+
+def get_assessment_analytics(assessment):
+    """Per-question and per-choice statistics of an assessment, read from the summary tables."""
+    from apps.assessments.models import Choice, Question
+
+    choices_by_question = defaultdict(list)
+    for choice in Choice.objects.filter(question__assessment=assessment).select_related("stats").order_by("id"):
+        choices_by_question[choice.question_id].append(choice)
+
+    questions = []
+    for question in Question.objects.filter(assessment=assessment).select_related("stats").order_by("id"):
+        stats = getattr(question, "stats", None)
+        answers = stats.answers_count if stats else 0
+        questions.append(
+            {
+                "question_id": question.id,
+                "description": question.description,
+                "is_active": question.is_active,
+                "answers_count": answers,
+                "correctness_rate": round(stats.correct_count / answers, 3) if answers else None,
+                "discrimination_index": discrimination_index(stats) if stats else None,
+                "choices": [_choice_analytics(choice, answers) for choice in choices_by_question[question.id]],
+            }
+        )
+
+    buckets = list(assessment.duration_buckets.order_by("minute").values_list("minute", "attempts_count"))
+    return {
+        "assessment_id": assessment.id,
+        "finished_attempts_count": sum(count for _, count in buckets),
+        "average_score": assessment.average_score,
+        "time_to_finish_minutes": duration_percentiles(buckets),
+        "questions": questions,
+    }
+
+
+EXPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+ASSESSMENT_TRANSFER_FIELDS = (
+    "name",
+    "description",
+    "language",
+    "minimum_requirements",
+    "topic",
+    "is_private",
+    "min_score",
+    "number_of_questions",
+    "allowed_attempts",
+    "time_limit",
+    "difficulty",
+)
+
+
+def _ndjson(record):
+    return json.dumps(record, ensure_ascii=False, cls=DjangoJSONEncoder) + "\n"
+
+
+def export_assessment_lines(assessment):
+    """
+    Yield an assessment as NDJSON: an "assessment" header line, then one "question" line per
+    question with its choices. Questions are read in chunks with their choices prefetched per
+    chunk, so memory stays flat however large the bank. Media fields are storage references.
+    """
+    from apps.assessments.models import Choice, Question
+
+    header = {field: getattr(assessment, field) for field in ASSESSMENT_TRANSFER_FIELDS}
+    header["topic"] = assessment.topic_id
+    header["spaces"] = list(assessment.spaces.order_by("id").values_list("id", flat=True))
+    header["image"] = assessment.image.name or None
+    yield _ndjson({"type": "assessment", **header})
+
+    questions = (
+        Question.objects.filter(assessment=assessment)
+        .order_by("id")
+        .prefetch_related(Prefetch("choices", queryset=Choice.objects.order_by("id")))
+    )
+    for question in questions.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield _ndjson(
+            {
+                "type": "question",
+                "description": question.description,
+                "is_multiple_choice": question.is_multiple_choice,
+                "is_active": question.is_active,
+                "audio": question.audio.name or None,
+                "image": question.image.name or None,
+                "file": question.file.name or None,
+                "choices": [
+                    {
+                        "description": choice.description,
+                        "correct_answer": choice.correct_answer,
+                        "audio": choice.audio.name or None,
+                        "image": choice.image.name or None,
+                    }
+                    for choice in question.choices.all()
+                ],
+            }
+        )
+
+
+def _import_error(line_number, errors):
+    return ValidationError({"line": line_number, "errors": errors})
+
+
+def _media_reference(value, upload_to, line_number):
+    """Accept a storage reference only inside the directory the field uploads to."""
+    if not value:
+        return None
+    directory = upload_to(None, "")
+    if not value.startswith(directory) or ".." in value:
+        raise _import_error(line_number, f"Media reference {value!r} must be inside {directory!r}.")
+    return value
+
+
+def import_assessment_lines(lines, user):
+    """
+    Create an assessment owned by `user` from NDJSON `lines` (bytes or str) in the export
+    format. Lines are parsed one at a time and questions are written with bulk_create every
+    IMPORT_BATCH_SIZE, so memory stays flat. Raises ValidationError naming the first bad line;
+    run it in a transaction so nothing is kept on error. Questions marked inactive skip the
+    choice rules. The assessment is left inactive when it has fewer active questions than
+    `number_of_questions`. Returns (assessment, questions_count, active_questions_count).
+    """
+    from apps.assessments import models
+    from apps.assessments.serializers import AssessmentImportSerializer, QuestionImportSerializer
+
+    def records():
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise _import_error(line_number, "Invalid JSON.")
+            if not isinstance(record, dict):
+                raise _import_error(line_number, "Each line must be a JSON object.")
+            yield line_number, record
+
+    parsed = records()
+    line_number, header = next(parsed, (1, None))
+    if header is None or header.pop("type", None) != "assessment":
+        raise _import_error(line_number, 'The first line must be the "assessment" header.')
+    image = _media_reference(header.pop("image", None), models.content_file_name, line_number)
+    header_serializer = AssessmentImportSerializer(data=header)
+    if not header_serializer.is_valid():
+        raise _import_error(line_number, header_serializer.errors)
+    assessment = header_serializer.save(user=user, image=image)
+
+    questions_count = active_count = 0
+    batch = []
+
+    def flush():
+        models.Question.objects.bulk_create([question for question, _ in batch])
+        models.Choice.objects.bulk_create(
+            [models.Choice(question=question, **choice) for question, choices in batch for choice in choices]
+        )
+        batch.clear()
+
+    for line_number, record in parsed:
+        if record.pop("type", None) != "question":
+            raise _import_error(line_number, 'Expected a "question" line.')
+        is_active = record.pop("is_active", True) is not False
+        serializer = QuestionImportSerializer(data=record)
+        if not serializer.is_valid():
+            raise _import_error(line_number, serializer.errors)
+        data = serializer.validated_data
+        choices = [
+            {
+                "description": choice["description"],
+                "correct_answer": choice["correct_answer"],
+                "audio": _media_reference(choice.get("audio"), models.choice_audio_upload, line_number),
+                "image": _media_reference(choice.get("image"), models.choice_image_upload, line_number),
+            }
+            for choice in data["choices"]
+        ]
+        if is_active:
+            error = choice_rules_error(
+                data["is_multiple_choice"], len(choices), sum(1 for c in choices if c["correct_answer"])
+            )
+            if error:
+                raise _import_error(line_number, error)
+        question = models.Question(
+            assessment=assessment,
+            description=data["description"],
+            is_multiple_choice=data["is_multiple_choice"],
+            is_active=is_active,
+            audio=_media_reference(data.get("audio"), models.question_audio_upload, line_number),
+            image=_media_reference(data.get("image"), models.question_image_upload, line_number),
+            file=_media_reference(data.get("file"), models.question_file_upload, line_number),
+        )
+        batch.append((question, choices))
+        questions_count += 1
+        active_count += is_active
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    if active_count < assessment.number_of_questions:
+        assessment.is_active = False
+        assessment.save(update_fields=["is_active"])
+    return assessment, questions_count, active_count
@@ -1,5 +1,9 @@
+from collections import defaultdict
+
 from django.db import transaction
-from django.db.models import Q, Count, Avg, Case, When, IntegerField, Exists, OuterRef
+from django.http import StreamingHttpResponse
+from django.db.models import Q, Count, Avg, Exists, OuterRef
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError
@@ -16,6 +20,14 @@ from apps.assessments.serializers import (
     FollowAssessmentSerializer,
     CreateFullAssessmentSerializer,
 )
+from apps.assessments.services import (
+    choice_rules_error,
+    export_assessment_lines,
+    get_assessment_analytics,
+    import_assessment_lines,
+    invalidate_question_pool,
+    with_viewer_state,
+)
 from apps.assessments.permissions import (
     AssessmentPermissions,
     QuestionChoicePermissions,
@@ -24,6 +36,7 @@ from apps.assessments.permissions import (
 )
 from apps.attempts.models import Attempt
 from apps.spaces.models import Space
+from apps.spaces.services import visible_in_spaces
 
 
 class AssessmentPagination(PageNumberPagination):
@@ -31,20 +44,22 @@ class AssessmentPagination(PageNumberPagination):
     page_size_query_param = "page_size"
 
 
+def with_choice_counts(questions):
+    """Annotate `total_choices` and `correct_choices` so many questions validate in one query."""
+    return questions.annotate(
+        total_choices=Count("choices"),
+        correct_choices=Count("choices", filter=Q(choices__correct_answer=True)),
+    )
+
+
 def validate_question(question):
-    total_choices = question.choices.count()
-    correct_choices = question.choices.filter(correct_answer=True).count()
-    if question.is_multiple_choice:
-        if total_choices < 3:
-            return "The question should have at least 3 choices."
-        if correct_choices < 2:
-            return "The question should have at least 2 correct choices."
+    """Error message if `question` breaks the choice rules, else None. Uses annotated counts when present."""
+    if hasattr(question, "total_choices"):
+        total_choices, correct_choices = question.total_choices, question.correct_choices
     else:
-        if total_choices < 2:
-            return "The question should have at least 2 choices."
-        if correct_choices != 1:
-            return "The question should have only 1 correct choice."
-    return None
+        total_choices = question.choices.count()
+        correct_choices = question.choices.filter(correct_answer=True).count()
+    return choice_rules_error(question.is_multiple_choice, total_choices, correct_choices)
 
 
 class AssessmentViewSet(viewsets.ModelViewSet):
@@ -78,7 +93,11 @@ class AssessmentViewSet(viewsets.ModelViewSet):
         user = self.request.user
         presented_param = self.request.query_params.get("presented")
 
-        base_qs = Assessment.objects.select_related("user", "topic", "topic__tag").prefetch_related("spaces")
+        base_qs = with_viewer_state(
+            Assessment.objects.select_related("user", "topic", "topic__tag").prefetch_related("spaces"),
+            user,
+            followers_count=self.action == "retrieve",
+        )
 
         if user.is_authenticated:
             qs = base_qs.filter(Q(is_active=True) | Q(user=user))
@@ -88,7 +107,7 @@ class AssessmentViewSet(viewsets.ModelViewSet):
         space_id = self.request.query_params.get("spaces")
         if space_id:
             if Space.user_is_member(user, space_id):
-                return qs.filter(spaces__id=space_id).distinct().order_by("id")
+                return qs.filter(spaces__id=space_id).order_by("id")
 
         if not user.is_authenticated:
             qs = qs.filter(is_private=False).order_by("id")
@@ -98,9 +117,9 @@ class AssessmentViewSet(viewsets.ModelViewSet):
 
         visibility = Q(is_private=False) | Q(user=user)
         if self.action == "retrieve":
-            visibility |= Q(spaces__owner=user) | Q(spaces__admins=user) | Q(spaces__members=user)
+            visibility |= Q(visible_in_spaces(user, Assessment.spaces.through, "assessment"))
 
-        qs = qs.filter(visibility).distinct().order_by("id")
+        qs = qs.filter(visibility).order_by("id")
         if presented_param is not None:
             presented = presented_param.lower() in ("true", "1", "yes")
             has_attempt = Exists(Attempt.objects.filter(assessment=OuterRef("pk"), user=user))
@@ -133,17 +152,51 @@ class AssessmentViewSet(viewsets.ModelViewSet):
         assessment.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=["GET"])
+    def analytics(self, request, pk=None):
+        """Per-question correctness, choice distribution, discrimination and time-to-finish. Owner only."""
+        assessment = self.get_object()
+        return Response(get_assessment_analytics(assessment), status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["GET"], url_path="export")
+    def export_assessment(self, request, pk=None):
+        """Stream the assessment, its questions and choices as NDJSON. Owner only."""
+        assessment = self.get_object()
+        response = StreamingHttpResponse(export_assessment_lines(assessment), content_type="application/x-ndjson")
+        response["Content-Disposition"] = f'attachment; filename="assessment-{assessment.id}.ndjson"'
+        return response
+
+    @action(detail=False, methods=["POST"], url_path="import")
+    def import_assessment(self, request):
+        """
+        Create an assessment from an NDJSON body in the export format. The body is read line by
+        line, never loaded whole.
+        """
+        stream = request.stream
+        if stream is None:
+            return Response({"error": "Expected an NDJSON request body."}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            assessment, questions_count, active_count = import_assessment_lines(
+                iter(stream.readline, b""), request.user
+            )
+        return Response(
+            {
+                "assessment": AssessmentSerializer(assessment, context={"request": request}).data,
+                "questions_count": questions_count,
+                "active_questions_count": active_count,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(detail=True, methods=["POST"], url_path="validate-and-activate")
     def validate_and_activate(self, request, pk=None):
         assessment = self.get_object()
 
-        inactive_questions = Question.objects.filter(assessment=assessment, is_active=False)
-
-        for question in inactive_questions:
-            error_message = validate_question(question)
-            if not error_message:
-                question.is_active = True
-                question.save()
+        inactive_questions = with_choice_counts(Question.objects.filter(assessment=assessment, is_active=False))
+        valid_ids = [question.id for question in inactive_questions if not validate_question(question)]
+        if valid_ids:
+            Question.objects.filter(id__in=valid_ids).update(is_active=True, updated_at=timezone.now())
+            invalidate_question_pool(assessment.id)
 
         active_question_count = Question.objects.filter(assessment=assessment, is_active=True).count()
         if active_question_count < assessment.number_of_questions:
@@ -167,26 +220,16 @@ class AssessmentViewSet(viewsets.ModelViewSet):
         questions_data = serializer.validated_data.pop("questions")
         number_of_questions = serializer.validated_data.get("number_of_questions", 10)
 
-        # Validate each question using the same rules as validate_question()
         errors = []
         for i, question_data in enumerate(questions_data):
             choices_data = question_data.get("choices", [])
-            total_choices = len(choices_data)
-            correct_choices = sum(1 for c in choices_data if c.get("correct_answer", False))
-            is_multiple_choice = question_data.get("is_multiple_choice", False)
-
-            if is_multiple_choice:
-                if total_choices < 3:
-                    errors.append({"question_index": i, "error": "The question should have at least 3 choices."})
-                elif correct_choices < 2:
-                    errors.append(
-                        {"question_index": i, "error": "The question should have at least 2 correct choices."}
-                    )
-            else:
-                if total_choices < 2:
-                    errors.append({"question_index": i, "error": "The question should have at least 2 choices."})
-                elif correct_choices != 1:
-                    errors.append({"question_index": i, "error": "The question should have only 1 correct choice."})
+            error_message = choice_rules_error(
+                question_data.get("is_multiple_choice", False),
+                len(choices_data),
+                sum(1 for c in choices_data if c.get("correct_answer", False)),
+            )
+            if error_message:
+                errors.append({"question_index": i, "error": error_message})
 
         if errors:
             return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -202,27 +245,29 @@ class AssessmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # Two INSERTs whatever the bank size; bulk_create fills in the question ids on Postgres.
         with transaction.atomic():
             assessment = serializer.save(user=request.user)
-
-            created_questions = []
-            for question_data in questions_data:
-                choices_data = question_data.pop("choices")
-                question = Question.objects.create(assessment=assessment, is_active=True, **question_data)
-
-                created_choices = []
-                for choice_data in choices_data:
-                    created_choices.append(Choice.objects.create(question=question, **choice_data))
-
-                created_questions.append((question, created_choices))
+            choices_data = [question_data.pop("choices") for question_data in questions_data]
+            questions = Question.objects.bulk_create(
+                [Question(assessment=assessment, is_active=True, **question_data) for question_data in questions_data]
+            )
+            choices = Choice.objects.bulk_create(
+                [
+                    Choice(question=question, **choice_data)
+                    for question, question_choices in zip(questions, choices_data)
+                    for choice_data in question_choices
+                ]
+            )
 
         assessment_data = AssessmentSerializer(assessment, context={"request": request}).data
 
-        questions_response = []
-        for question, choices in created_questions:
-            q_data = QuestionSerializer(question).data
-            q_data["choices"] = ChoiceSerializer(choices, many=True).data
-            questions_response.append(q_data)
+        choices_by_question = defaultdict(list)
+        for choice_data in ChoiceSerializer(choices, many=True).data:
+            choices_by_question[choice_data["question"]].append(choice_data)
+        questions_response = QuestionSerializer(questions, many=True).data
+        for question_data in questions_response:
+            question_data["choices"] = choices_by_question[question_data["id"]]
 
         return Response(
             {"assessment": assessment_data, "questions": questions_response},
@@ -288,10 +333,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
         if user_owned_questions_count != len(question_ids):
             return Response({"error": "Some questions do not belong to you."}, status=status.HTTP_403_FORBIDDEN)
 
-        questions = Question.objects.filter(id__in=question_ids).annotate(
-            total_choices=Count("choices"),
-            correct_choices=Count(Case(When(choices__correct_answer=True, then=1), output_field=IntegerField())),
-        )
+        questions = with_choice_counts(Question.objects.filter(id__in=question_ids))
         errors = []
         to_activate = []
         for question in questions:
@@ -303,7 +345,10 @@ class QuestionViewSet(viewsets.ModelViewSet):
         if errors:
             return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
 
-        Question.objects.filter(id__in=[q.id for q in to_activate]).update(is_active=True)
+        Question.objects.filter(id__in=[q.id for q in to_activate]).update(is_active=True, updated_at=timezone.now())
+        # update() skips post_save, so drop the cached question pools by hand.
+        for assessment_id in {q.assessment_id for q in to_activate}:
+            invalidate_question_pool(assessment_id)
         return Response({"detail": "Questions validated and activated successfully."}, status=status.HTTP_200_OK)
 
     def destroy(self, request, *args, **kwargs):
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.attempts.services import reconcile_score_averages
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored score sums, counts and averages of assessments, users and user points."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = reconcile_score_averages()
+        for table, rows in updated.items():
+            self.stdout.write(f"{table}: {rows} rows reconciled")
+        self.stdout.write(self.style.SUCCESS("Score averages reconciled."))
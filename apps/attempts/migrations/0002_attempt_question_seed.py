@@ -0,0 +1,28 @@
+# Generated by Django 4.2.6 on 2026-10-19 02:58
+
+import apps.attempts.models
+from django.db import migrations, models
+
+
+def reseed_existing_attempts(apps, schema_editor):
+    # AddField evaluates the callable default once, so every existing row got the same seed.
+    Attempt = apps.get_model('attempts', 'Attempt')
+    schema_editor.execute(
+        f"UPDATE {schema_editor.quote_name(Attempt._meta.db_table)} SET question_seed = floor(random() * 2147483648)"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attempts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='question_seed',
+            field=models.PositiveIntegerField(default=apps.attempts.models.new_question_seed, editable=False),
+        ),
+        migrations.RunPython(reseed_existing_attempts, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attempts', '0002_attempt_question_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpoints',
+            name='score_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userpoints',
+            name='scored_attempts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
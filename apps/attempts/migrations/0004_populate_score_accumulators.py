@@ -0,0 +1,53 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:04
+
+from django.db import migrations
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def _aggregate_per_row(attempts, aggregate, default, **outer_refs):
+    group_by = next(iter(outer_refs))
+    per_row = (
+        attempts.filter(**{field: OuterRef(ref) for field, ref in outer_refs.items()})
+        .values(group_by)
+        .annotate(value=aggregate)
+        .values("value")
+    )
+    return Coalesce(Subquery(per_row), default)
+
+
+def populate_score_accumulators(apps, schema_editor):
+    # A frozen copy of apps.attempts.services.reconcile_score_averages as of this migration.
+    Assessment = apps.get_model("assessments", "Assessment")
+    Attempt = apps.get_model("attempts", "Attempt")
+    UserPoints = apps.get_model("attempts", "UserPoints")
+    CustomUser = apps.get_model("users", "CustomUser")
+
+    finished = Attempt.objects.filter(is_finished=True).order_by()
+
+    def stats(**outer_refs):
+        return {
+            "score_sum": _aggregate_per_row(finished, Sum("score"), 0.0, **outer_refs),
+            "scored_attempts_count": _aggregate_per_row(finished, Count("id"), 0, **outer_refs),
+            "average_score": _aggregate_per_row(finished, Avg("score"), 0.0, **outer_refs),
+        }
+
+    Assessment.objects.update(
+        **stats(assessment="pk"),
+        attempts_count=_aggregate_per_row(Attempt.objects.order_by(), Count("id"), 0, assessment="pk"),
+    )
+    CustomUser.objects.update(**stats(user="pk"))
+    UserPoints.objects.update(**stats(user="user", assessment__topic="category"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("assessments", "0002_assessment_score_accumulators"),
+        ("attempts", "0003_userpoints_score_accumulators"),
+        ("users", "0014_customuser_score_accumulators"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_score_accumulators, reverse_code=migrations.RunPython.noop),
+    ]
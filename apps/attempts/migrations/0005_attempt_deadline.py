@@ -0,0 +1,22 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attempts', '0004_populate_score_accumulators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(condition=models.Q(('is_finished', False)), fields=['deadline'], name='attempts_open_deadline_idx'),
+        ),
+    ]
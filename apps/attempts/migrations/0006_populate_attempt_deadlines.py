@@ -0,0 +1,25 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:05
+
+from datetime import timedelta
+
+from django.db import migrations
+
+
+def populate_deadlines(apps, schema_editor):
+    Attempt = apps.get_model("attempts", "Attempt")
+
+    open_attempts = Attempt.objects.filter(is_finished=False, deadline__isnull=True).select_related("assessment")
+    for attempt in open_attempts.iterator():
+        attempt.deadline = attempt.start_time + timedelta(minutes=attempt.assessment.time_limit + 2)
+        attempt.save(update_fields=["deadline"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attempts", "0005_attempt_deadline"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_deadlines, reverse_code=migrations.RunPython.noop),
+    ]
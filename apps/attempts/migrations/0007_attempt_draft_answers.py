@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attempts', '0006_populate_attempt_deadlines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='draft_answers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='draft_saved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,7 @@
+import random
+
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -7,6 +10,10 @@ from apps.base.models import Topic
 from apps.users.models import CustomUser
 
 
+def new_question_seed():
+    return random.randrange(2**31)
+
+
 class Attempt(models.Model):
     assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name="attempts")
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="attempts")
@@ -16,7 +23,17 @@ class Attempt(models.Model):
     is_finished = models.BooleanField(default=False)
     start_time = models.DateTimeField(auto_now_add=True)
     end_time = models.DateTimeField(null=True, blank=True)
+    deadline = models.DateTimeField(null=True, blank=True)  # finalized by the expiry sweeper after this
     points_obtained = models.IntegerField(default=0)
+    question_seed = models.PositiveIntegerField(default=new_question_seed, editable=False)
+    # Autosaved answers, {"<question_id>": [choice_id, ...]}, graded at finalization.
+    draft_answers = models.JSONField(default=dict, blank=True)
+    draft_saved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deadline"], condition=Q(is_finished=False), name="attempts_open_deadline_idx"),
+        ]
 
     @property
     def correct_answers_count(self):
@@ -41,6 +58,8 @@ class UserPoints(models.Model):
     category = models.ForeignKey(Topic, on_delete=models.CASCADE)
     total_points = models.PositiveIntegerField(default=0)
     average_score = models.FloatField(null=True, blank=True)
+    score_sum = models.FloatField(default=0)  # running sum/count of finished attempt scores
+    scored_attempts_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ("user", "category")
@@ -40,8 +40,17 @@ class AttemptDetailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Attempt
-        fields = "__all__"
-        read_only_fields = ("user", "score", "approved", "start_time", "end_time")
+        exclude = ("question_seed",)
+        read_only_fields = (
+            "user",
+            "score",
+            "approved",
+            "start_time",
+            "end_time",
+            "deadline",
+            "draft_answers",
+            "draft_saved_at",
+        )
 
     def get_available_attempts(self, obj):
         return obj.assessment.get_available_attempts(self.context["request"].user)
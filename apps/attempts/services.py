@@ -1,7 +1,19 @@
+from datetime import timedelta
+
+from django.apps import apps as global_apps
 from django.db import transaction
-from django.db.models import Avg
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Avg, Count, F, Func, JSONField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from apps.assessments.services import record_attempt_analytics
+
+
+DRAFT_MAX_ANSWERS = 100
+# Answers are accepted this long past the time limit, matching finalize_attempt.
+FINALIZATION_TOLERANCE = timedelta(seconds=5)
+
 
 def calculate_points(assessment, score):
     D_teacher = assessment.difficulty
@@ -9,64 +21,220 @@ def calculate_points(assessment, score):
     return round(score * ((D_teacher + D_students) / 20.0))
 
 
-def update_assessment_average_score(assessment):
-    from apps.attempts.models import Attempt
+def add_score(score, **extra):
+    """
+    update() kwargs folding one more score into the running `score_sum`/`scored_attempts_count`
+    accumulators and the stored `average_score`. Every right-hand side reads the old row values.
+    """
+    return {
+        "score_sum": F("score_sum") + score,
+        "scored_attempts_count": F("scored_attempts_count") + 1,
+        "average_score": (F("score_sum") + score) / (F("scored_attempts_count") + 1),
+        **extra,
+    }
+
+
+def record_attempt_score(attempt, user_points_id=None):
+    """
+    Add a finished attempt's score and points to its assessment, user and topic UserPoints
+    with one UPDATE per row, whatever the size of the attempt history.
+    """
+    from apps.assessments.models import Assessment
+    from apps.attempts.models import UserPoints
+    from apps.users.models import CustomUser
+
+    Assessment.objects.filter(pk=attempt.assessment_id).update(**add_score(attempt.score))
+    CustomUser.objects.filter(pk=attempt.user_id).update(
+        **add_score(attempt.score, points=F("points") + attempt.points_obtained)
+    )
+    if user_points_id:
+        UserPoints.objects.filter(pk=user_points_id).update(
+            **add_score(attempt.score, total_points=F("total_points") + attempt.points_obtained)
+        )
+
+
+def _aggregate_per_row(attempts, aggregate, default, **outer_refs):
+    """Coalesced correlated subquery computing `aggregate` over the `attempts` of each outer row."""
+    group_by = next(iter(outer_refs))
+    per_row = (
+        attempts.filter(**{field: OuterRef(ref) for field, ref in outer_refs.items()})
+        .values(group_by)
+        .annotate(value=aggregate)
+        .values("value")
+    )
+    return Coalesce(Subquery(per_row), default)
+
+
+def reconcile_score_averages(apps=global_apps):
+    """
+    Recompute every score accumulator and stored average from the finished attempts, with one
+    set-based UPDATE per table. Returns the number of rows updated per table. Pass a
+    migration's `apps` to run it against historical models.
+    """
+    Assessment = apps.get_model("assessments", "Assessment")
+    Attempt = apps.get_model("attempts", "Attempt")
+    UserPoints = apps.get_model("attempts", "UserPoints")
+    CustomUser = apps.get_model("users", "CustomUser")
+
+    finished = Attempt.objects.filter(is_finished=True).order_by()
+
+    def stats(**outer_refs):
+        return {
+            "score_sum": _aggregate_per_row(finished, Sum("score"), 0.0, **outer_refs),
+            "scored_attempts_count": _aggregate_per_row(finished, Count("id"), 0, **outer_refs),
+            "average_score": _aggregate_per_row(finished, Avg("score"), 0.0, **outer_refs),
+        }
 
-    avg_score = Attempt.objects.filter(assessment=assessment).aggregate(avg_score=Avg("score"))["avg_score"]
-    assessment.average_score = avg_score or 0
-    assessment.save()
+    return {
+        "assessments": Assessment.objects.update(
+            **stats(assessment="pk"),
+            attempts_count=_aggregate_per_row(Attempt.objects.order_by(), Count("id"), 0, assessment="pk"),
+        ),
+        "users": CustomUser.objects.update(**stats(user="pk")),
+        "user_points": UserPoints.objects.update(**stats(user="user", assessment__topic="category")),
+    }
 
 
-def update_user_average_score(user, user_points=None):
+def _choice_ids(values):
+    ids = set()
+    for value in values or []:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            ids.add(None)  # unknown choice: keeps the answer from matching, is never stored
+    return ids
+
+
+def grade_answers(attempt, answers):
+    """
+    Grade `answers` ([{"question_id": ..., "choices": [...]}, ...]) against the attempt's
+    assessment and store them as QuestionAttempts. Correct and valid choice ids of every
+    answered question are loaded in one query and compared in memory; the rows and their
+    selected choices are written with one bulk_create each.
+    Returns the question attempts and, in the same order, the set of choice ids stored for each.
+    """
+    from apps.assessments.models import Question
+    from apps.attempts.models import QuestionAttempt
+
+    selected_by_question = {}
+    for answer in answers:
+        try:
+            question_id = int(answer.get("question_id"))
+        except (AttributeError, TypeError, ValueError):
+            continue
+        selected_by_question.setdefault(question_id, _choice_ids(answer.get("choices")))
+
+    choices_by_question = {
+        question_id: (set(choice_ids) - {None}, set(correct_ids) - {None})
+        for question_id, choice_ids, correct_ids in Question.objects.filter(
+            assessment_id=attempt.assessment_id, id__in=selected_by_question
+        )
+        .annotate(
+            choice_ids=ArrayAgg("choices__id", default=Value([])),
+            correct_ids=ArrayAgg("choices__id", filter=Q(choices__correct_answer=True), default=Value([])),
+        )
+        .values_list("id", "choice_ids", "correct_ids")
+    }
+
+    question_attempts = []
+    selected_rows = []
+    for question_id, (choice_ids, correct_ids) in choices_by_question.items():
+        selected = selected_by_question[question_id]
+        question_attempts.append(
+            QuestionAttempt(attempt=attempt, question_id=question_id, is_correct=selected == correct_ids)
+        )
+        selected_rows.append(selected & choice_ids)
+
+    QuestionAttempt.objects.bulk_create(question_attempts)
+    Through = QuestionAttempt.selected_choices.through
+    Through.objects.bulk_create(
+        [
+            Through(questionattempt_id=qa.id, choice_id=choice_id)
+            for qa, selected in zip(question_attempts, selected_rows)
+            for choice_id in selected
+        ]
+    )
+    return question_attempts, selected_rows
+
+
+def parse_draft_answers(data):
+    """
+    Validate autosave input, a list of {"question_id": int, "choices": [int, ...]}, into the
+    draft format. Returns None when malformed.
+    """
+    if not isinstance(data, list) or len(data) > DRAFT_MAX_ANSWERS:
+        return None
+    draft = {}
+    for answer in data:
+        if not isinstance(answer, dict):
+            return None
+        question_id, choices = answer.get("question_id"), answer.get("choices", [])
+        if not isinstance(question_id, int) or not isinstance(choices, list):
+            return None
+        if not all(isinstance(choice_id, int) for choice_id in choices):
+            return None
+        draft[str(question_id)] = sorted(set(choices))
+    return draft
+
+
+def save_draft_answers(attempt_id, user_id, draft):
+    """
+    Merge `draft` into the attempt's saved answers with a single UPDATE (jsonb `||`, so the
+    latest write wins per question). Only the taker can save, and only while the attempt is
+    open and within its time limit. Returns whether the attempt was updated.
+    """
     from apps.attempts.models import Attempt
+    from apps.attempts.tasks import ATTEMPT_EXPIRY_GRACE
 
-    user.average_score = Attempt.objects.filter(user=user).aggregate(avg_score=Avg("score"))["avg_score"] or 0
-    user.save()
-    if user_points:
-        category_attempts = Attempt.objects.filter(user=user, assessment__topic=user_points.category)
-        user_points.average_score = category_attempts.aggregate(Avg("score"))["score__avg"] or 0
-        user_points.save()
+    now = timezone.now()
+    merged = Func(
+        F("draft_answers"),
+        Value(draft, output_field=JSONField()),
+        template="%(expressions)s",
+        arg_joiner=" || ",
+        output_field=JSONField(),
+    )
+    return bool(
+        Attempt.objects.filter(
+            pk=attempt_id,
+            user_id=user_id,
+            is_finished=False,
+            deadline__gt=now + ATTEMPT_EXPIRY_GRACE - FINALIZATION_TOLERANCE,
+        ).update(draft_answers=merged, draft_saved_at=now)
+    )
 
 
-def process_finalization(attempt, answers):
+def process_finalization(attempt, answers=None):
     """
     Core finalization logic shared between the user-triggered endpoint and
-    the auto-expiry Celery task. Pass answers=[] to finalize with score 0.
+    the auto-expiry Celery task. Pass answers=None to grade the autosaved draft.
     Returns the finalized attempt, or the already-finished attempt if called twice.
     """
-    from apps.assessments.models import Question
-    from apps.attempts.models import Attempt, QuestionAttempt, UserPoints
+    from apps.attempts.models import Attempt, UserPoints
 
     with transaction.atomic():
-        attempt = Attempt.objects.select_for_update().get(pk=attempt.pk)
+        attempt = (
+            Attempt.objects.select_for_update(of=("self",))
+            .select_related("assessment")
+            .get(pk=attempt.pk)
+        )
 
         if attempt.is_finished:
             return attempt
 
-        question_attempts_to_create = []
-        for answer in answers:
-            question_id = answer.get("question_id")
-            selected_choices = set(answer.get("choices", []))
-            try:
-                question = Question.objects.get(pk=question_id)
-            except Question.DoesNotExist:
-                continue
-            correct_choices_ids = set(question.choices.filter(correct_answer=True).values_list("id", flat=True))
-            is_correct = correct_choices_ids == selected_choices
-            question_attempts_to_create.append(
-                QuestionAttempt(attempt=attempt, question_id=question_id, is_correct=is_correct)
-            )
-
-        QuestionAttempt.objects.bulk_create(question_attempts_to_create)
-        for qa, answer in zip(question_attempts_to_create, answers):
-            qa.selected_choices.set(answer.get("choices", []))
+        if answers is None:
+            answers = [
+                {"question_id": question_id, "choices": choices}
+                for question_id, choices in attempt.draft_answers.items()
+            ]
+        question_attempts, selected_choice_ids = grade_answers(attempt, answers)
+        correct_answers_count = sum(qa.is_correct for qa in question_attempts)
 
         total_questions = attempt.assessment.number_of_questions
-        correct_answers_count = attempt.question_attempts.filter(is_correct=True).count()
         attempt.score = (correct_answers_count / total_questions) * 100 if total_questions else 0
         attempt.approved = attempt.score >= attempt.assessment.min_score
         best_attempt = (
-            Attempt.objects.filter(assessment=attempt.assessment, user=attempt.user)
+            Attempt.objects.filter(assessment_id=attempt.assessment_id, user_id=attempt.user_id)
             .exclude(pk=attempt.pk)
             .order_by("-score")
             .first()
@@ -76,25 +244,24 @@ def process_finalization(attempt, answers):
         best_raw = calculate_points(attempt.assessment, best_attempt.score) if best_attempt else 0
         attempt.points_obtained = max(0, raw_points - best_raw)
 
-        user_points = None
-        if attempt.assessment.topic:
+        user_points_id = None
+        if attempt.assessment.topic_id:
             user_points, _ = UserPoints.objects.get_or_create(
-                user=attempt.user, category=attempt.assessment.topic, defaults={"total_points": 0}
+                user_id=attempt.user_id, category_id=attempt.assessment.topic_id, defaults={"total_points": 0}
             )
-
-        if attempt.points_obtained > 0:
-            attempt.user.points += attempt.points_obtained
-            if user_points:
-                user_points.total_points += attempt.points_obtained
-            attempt.user.save()
-            if user_points:
-                user_points.save()
+            user_points_id = user_points.pk
 
         attempt.is_finished = True
         attempt.end_time = attempt.end_time or timezone.now()
+        attempt.draft_answers = {}
         attempt.save()
 
-        update_user_average_score(attempt.user, user_points)
-        update_assessment_average_score(attempt.assessment)
+        # Still under the attempt's row lock, so a finalization is counted exactly once.
+        record_attempt_score(attempt, user_points_id)
+        # The analytics rows are shared by every attempt of the assessment; update them after
+        # the lock is released. A failure there is logged and leaves the finalization intact.
+        transaction.on_commit(
+            lambda: record_attempt_analytics(attempt, question_attempts, selected_choice_ids), robust=True
+        )
 
     return attempt
@@ -1,7 +1,6 @@
-import random
 from datetime import timedelta
 
-from django.db.models import Q, Prefetch
+from django.db.models import F, Q
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
@@ -18,9 +17,17 @@ from apps.attempts.serializers import (
     UserPointsSerializer,
 )
 from apps.attempts.permissions import AttemptBasedPermissions
-from apps.attempts.services import process_finalization, update_assessment_average_score, update_user_average_score
-from apps.attempts.tasks import finalize_expired_attempt
-from apps.assessments.models import Assessment, Question, Choice
+from apps.attempts.services import (
+    FINALIZATION_TOLERANCE,
+    parse_draft_answers,
+    process_finalization,
+    save_draft_answers,
+)
+from apps.attempts.tasks import ATTEMPT_EXPIRY_GRACE
+from apps.assessments.models import Assessment, Question
+from apps.assessments.services import get_question_pool, sample_questions
+from apps.base.services import get_platform_stats
+from apps.spaces.services import get_visible_space_ids
 
 
 class AttemptViewSet(viewsets.ModelViewSet):
@@ -55,9 +62,7 @@ class AttemptViewSet(viewsets.ModelViewSet):
             raise ValidationError("You cannot attempt your own assessment.")
 
         if assessment.is_private:
-            is_space_member = assessment.spaces.filter(
-                Q(owner=self.request.user) | Q(admins=self.request.user) | Q(members=self.request.user)
-            ).exists()
+            is_space_member = assessment.spaces.filter(id__in=get_visible_space_ids(self.request.user)).exists()
             if not is_space_member:
                 raise ValidationError("You do not have permission to attempt this assessment.")
 
@@ -65,43 +70,51 @@ class AttemptViewSet(viewsets.ModelViewSet):
         perfect_score_exists = Attempt.objects.filter(assessment=assessment, user=self.request.user, score=100).exists()
         if previous_attempts_count >= assessment.allowed_attempts or perfect_score_exists:
             raise ValidationError("You don't have any attempts left for this assessment.")
-        assessment.attempts_count = Attempt.objects.filter(assessment=assessment).count() + 1
-        update_assessment_average_score(assessment)
-        update_user_average_score(self.request.user)
-        attempt = serializer.save(user=self.request.user)
-        eta = attempt.start_time + timedelta(minutes=assessment.time_limit + 2)
-        finalize_expired_attempt.apply_async(args=[attempt.id], eta=eta)
+        # sweep_expired_attempts finalizes the attempt once the deadline passes.
+        deadline = timezone.now() + timedelta(minutes=assessment.time_limit) + ATTEMPT_EXPIRY_GRACE
+        serializer.save(user=self.request.user, deadline=deadline)
+        Assessment.objects.filter(pk=assessment.pk).update(attempts_count=F("attempts_count") + 1)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
-        # Getting random questions for attempt:
-        if request.user == instance.user and not instance.questions_provided:
-            assessment = instance.assessment
-            number_of_questions = assessment.number_of_questions
-            random_questions = Question.objects.filter(assessment=assessment).order_by("?")[:number_of_questions]
-            random_questions_with_choices = random_questions.prefetch_related(
-                Prefetch("choices", queryset=Choice.objects.all(), to_attr="fetched_choices")
-            )
-            questions_data = [
-                {
-                    "question_id": q.id,
-                    "description": q.description,
-                    "is_multiple_choice": q.is_multiple_choice,
-                    "choices": [
-                        {"choice_id": c.id, "description": c.description}
-                        for c in random.sample(q.fetched_choices, len(q.fetched_choices))
-                    ],
-                }
-                for q in random_questions_with_choices
-            ]
+        # The paper is drawn from the cached question pool with the attempt's own seed, so
+        # reloading an unfinished attempt returns the same questions in the same order.
+        if request.user == instance.user and not instance.is_finished:
+            pool = get_question_pool(instance.assessment_id)
             response_data = serializer.data
-            response_data["questions"] = questions_data
-            instance.questions_provided = True
-            instance.save(update_fields=["questions_provided"])
+            response_data["questions"] = sample_questions(
+                pool, instance.assessment.number_of_questions, instance.question_seed
+            )
+            if not instance.questions_provided:
+                instance.questions_provided = True
+                instance.save(update_fields=["questions_provided"])
             return Response(response_data)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["POST"])
+    def autosave(self, request, pk=None):
+        """
+        Save in-progress answers, a list of {"question_id", "choices"}; later saves replace earlier
+        ones per question. They are graded if the attempt expires before it is finalized.
+        """
+        if not str(pk).isdigit():
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        draft = parse_draft_answers(request.data)
+        if draft is None:
+            return Response(
+                {"error": "Expected a list of {question_id, choices} answers."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if save_draft_answers(pk, request.user.id, draft):
+            return Response({"detail": "Answers saved.", "saved": len(draft)}, status=status.HTTP_200_OK)
+
+        if not Attempt.objects.filter(pk=pk, user_id=request.user.id).exists():
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"error": "The attempt is finished or exceeded the allowed time limit."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(detail=True, methods=["POST"])
     def finalize_attempt(self, request, pk=None):
         attempt = self.get_object()
@@ -121,7 +134,8 @@ class AttemptViewSet(viewsets.ModelViewSet):
             )
 
         now = timezone.now()
-        expected_end_time = attempt.start_time + timedelta(minutes=attempt.assessment.time_limit, seconds=5)
+        time_limit = timedelta(minutes=attempt.assessment.time_limit)
+        expected_end_time = attempt.start_time + time_limit + FINALIZATION_TOLERANCE
         if now > expected_end_time:
             return Response(
                 {"error": "The attempt exceeded the allowed time limit."}, status=status.HTTP_400_BAD_REQUEST
@@ -175,10 +189,7 @@ class QuestionAttemptViewSet(viewsets.ModelViewSet):
 
 class GlobalStatsAPIView(APIView):
     def get(self, request, format=None):
-        total_attempts = Attempt.objects.count()
-        total_assessments = Assessment.objects.filter(is_active=True).count()
-        stats_data = {"total_attempts": total_attempts, "total_assessments": total_assessments}
-        return Response(stats_data, status=status.HTTP_200_OK)
+        return Response(get_platform_stats(), status=status.HTTP_200_OK)
 
 
 class RankingPagination(PageNumberPagination):
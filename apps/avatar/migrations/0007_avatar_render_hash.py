@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("avatar", "0006_avatar_ki_color_avatar_ki_item_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="avatar",
+            name="render_hash",
+            field=models.CharField(blank=True, default="", max_length=32),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
+from apps.avatar.services import bump_catalog_version
 from apps.users.models import CustomUser
 
 
@@ -131,4 +134,15 @@ class Avatar(models.Model):
         UserUnlockedColor, null=True, blank=True, on_delete=models.SET_NULL, related_name="used_for_ki"
     )
     skin_color = models.ForeignKey(UserUnlockedSkinColor, on_delete=models.PROTECT, related_name="used_for_skin")
+    render_hash = models.CharField(max_length=32, blank=True, default="")
     updated_at = models.DateTimeField(auto_now=True)
+
+
+@receiver(post_save, sender=AvatarItemCatalog)
+@receiver(post_delete, sender=AvatarItemCatalog)
+@receiver(post_save, sender=AvatarColorCatalog)
+@receiver(post_delete, sender=AvatarColorCatalog)
+@receiver(post_save, sender=AvatarSkinColorCatalog)
+@receiver(post_delete, sender=AvatarSkinColorCatalog)
+def bump_catalog_version_on_change(sender, instance, **kwargs):
+    bump_catalog_version()
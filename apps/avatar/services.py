@@ -0,0 +1,273 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+
+
+CATALOG_VERSION_KEY = "avatar:catalog_version"
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+OWNED_UNLOCKS_CACHE_TIMEOUT = 60 * 60
+
+# Bump when the render document format changes; it is part of every render hash.
+AVATAR_RENDER_VERSION = 1
+AVATAR_RENDER_DIR = "avatars/renders"
+AVATAR_RENDER_CACHE_TIMEOUT = 60 * 60 * 24
+# Renders composed inside a request at most; the others are composed by a Celery task.
+AVATAR_RENDER_MAX_COMPOSE = 10
+# Render files no avatar points to any more are deleted once they are this old.
+AVATAR_RENDER_RETENTION = timedelta(days=7)
+# Item slots in drawing order, back to front.
+RENDER_ITEM_SLOTS = ("ki", "face", "pants", "shoes", "shirt", "hair", "accessory")
+RENDER_COLOR_SLOTS = ("ki", "pants", "shoes", "shirt", "hair", "accessory")
+AVATAR_SLOTS = ("face", "hair", "shirt", "pants", "shoes", "accessory", "ki")
+
+
+def _item_row(item):
+    return {
+        "id": item.id,
+        "code": item.code,
+        "name": item.name,
+        "svg": item.svg,
+        "item_type": item.item_type,
+        "gender": item.avatar_type,
+        "price": item.price,
+    }
+
+
+def _color_row(color):
+    return {"id": color.id, "code": color.code, "name": color.name, "hex": color.hex, "price": color.price}
+
+
+def _skin_color_row(skin):
+    return {
+        "id": skin.id,
+        "code": skin.code,
+        "name": skin.name,
+        "main_color": skin.main_color,
+        "second_color": skin.second_color,
+        "price": skin.price,
+    }
+
+
+def catalog_kinds():
+    """Catalog kind -> (catalog model, unlock model, ordering, row builder)."""
+    from apps.avatar.models import (
+        AvatarColorCatalog,
+        AvatarItemCatalog,
+        AvatarSkinColorCatalog,
+        UserUnlockedColor,
+        UserUnlockedItem,
+        UserUnlockedSkinColor,
+    )
+
+    return {
+        "avatar_item": (AvatarItemCatalog, UserUnlockedItem, ("name", "id"), _item_row),
+        "item_color": (AvatarColorCatalog, UserUnlockedColor, ("code",), _color_row),
+        "skin_color": (AvatarSkinColorCatalog, UserUnlockedSkinColor, ("code",), _skin_color_row),
+    }
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, None)
+
+
+def bump_catalog_version():
+    """Retire every cached catalog; the entries under the old version simply expire."""
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def get_catalog(kind):
+    """
+    Static part of a catalog, shared by all users: `rows`, the active entries in display
+    order, and `by_id`, every entry (inactive ones included, for items users already own).
+    """
+
+    def load():
+        Catalog, _unlock, ordering, row = catalog_kinds()[kind]
+        rows, by_id = [], {}
+        for entry in Catalog.objects.order_by(*ordering):
+            by_id[entry.id] = row(entry)
+            if entry.is_active:
+                rows.append(by_id[entry.id])
+        return {"rows": rows, "by_id": by_id}
+
+    return cache.get_or_set(f"avatar:catalog:{kind}:{catalog_version()}", load, CATALOG_CACHE_TIMEOUT)
+
+
+def owned_unlocks_state(user_id):
+    """
+    Fingerprint of the user's unlocks read from the database in one query: the row count and
+    highest id of each unlock table. Any purchase or removal changes it.
+    """
+    Unlocks = [Unlock for _catalog, Unlock, _ordering, _row in catalog_kinds().values()]
+    columns = ", ".join(
+        f"(SELECT COUNT(*) || ':' || COALESCE(MAX(id), 0) FROM {Unlock._meta.db_table} WHERE user_id = %s)"
+        for Unlock in Unlocks
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {columns}", [user_id] * len(Unlocks))
+        return "|".join(cursor.fetchone())
+
+
+def get_owned_unlocks(user_id):
+    """
+    The user's unlocks as {kind: {catalog_id: unlock_id}} plus their `version`, the
+    owned_unlocks_state() they were loaded at. Cached per user under that state, so a
+    purchase is visible on the next request without any invalidation.
+    """
+    version = owned_unlocks_state(user_id)
+
+    def load():
+        owned = {"version": version}
+        for kind, (_catalog, Unlock, _ordering, _row) in catalog_kinds().items():
+            owned[kind] = dict(Unlock.objects.filter(user_id=user_id).values_list("catalog_item_id", "id"))
+        return owned
+
+    return cache.get_or_set(f"avatar:owned:{user_id}:{version}", load, OWNED_UNLOCKS_CACHE_TIMEOUT)
+
+
+def catalog_etag(request, owned):
+    """ETag of a catalog response: the request URL, the catalog version and the owned-unlocks state."""
+    key = f"{request.get_full_path()}|{catalog_version()}|{owned['version']}"
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("If-None-Match", "")
+    return etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
+
+
+def with_avatar_relations(avatars):
+    """
+    Join every unlock an avatar uses and its catalog entry, so AvatarSerializer renders any
+    number of avatars from this one query.
+    """
+    return avatars.select_related(
+        *[f"{slot}_item__catalog_item" for slot in AVATAR_SLOTS],
+        *[f"{slot}_color__catalog_item" for slot in AVATAR_SLOTS if slot != "face"],
+        "eyes_color",
+        "skin_color__catalog_item",
+    )
+
+
+def _render_fields():
+    fields = ["user_id", "updated_at", "avatar_type", "eyes_color__color_code"]
+    fields += ["skin_color__catalog_item__main_color", "skin_color__catalog_item__second_color"]
+    fields += [f"{slot}_item__catalog_item__svg" for slot in RENDER_ITEM_SLOTS]
+    fields += [f"{slot}_color__catalog_item__hex" for slot in RENDER_COLOR_SLOTS]
+    return fields
+
+
+def compose_avatar(row):
+    """
+    The render document of one avatar: its layers in drawing order with their resolved
+    artwork and colors, so a client draws the avatar from a single file.
+    """
+    from apps.avatar.items.item_colors import COLORS
+
+    eyes = COLORS.get(row["eyes_color__color_code"])
+    return {
+        "version": AVATAR_RENDER_VERSION,
+        "avatar_type": row["avatar_type"],
+        "skin": {
+            "main_color": row["skin_color__catalog_item__main_color"],
+            "second_color": row["skin_color__catalog_item__second_color"],
+        },
+        "eyes_color": eyes["hex"] if eyes else None,
+        "layers": [
+            {
+                "slot": slot,
+                "svg": row[f"{slot}_item__catalog_item__svg"],
+                "color": row.get(f"{slot}_color__catalog_item__hex"),
+            }
+            for slot in RENDER_ITEM_SLOTS
+            if row[f"{slot}_item__catalog_item__svg"]
+        ],
+    }
+
+
+def _store_render(document):
+    """Write the document to media storage under its content hash, once. Returns (hash, url)."""
+    content = json.dumps(document, sort_keys=True, separators=(",", ":")).encode()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    name = f"{AVATAR_RENDER_DIR}/{digest}.json"
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return digest, default_storage.url(name)
+
+
+def _render_key(user_id, updated_at, version):
+    return f"avatar:render:{user_id}:{updated_at.timestamp()}:{version}"
+
+
+def compose_avatar_renders(user_ids):
+    """
+    Compose and store the renders of the given users' avatars, cache them and record each
+    avatar's current render hash. One values() query resolves every avatar through its
+    catalog joins. Returns {user_id: {"hash", "url", "updated_at"}}.
+    """
+    from apps.avatar.models import Avatar
+
+    version = catalog_version()
+    renders, fresh, hashes = {}, {}, []
+    for row in Avatar.objects.filter(user_id__in=user_ids).values("id", *_render_fields()):
+        digest, url = _store_render(compose_avatar(row))
+        user_id = row["user_id"]
+        renders[user_id] = {"hash": digest, "url": url, "updated_at": row["updated_at"].isoformat()}
+        fresh[_render_key(user_id, row["updated_at"], version)] = renders[user_id]
+        hashes.append(Avatar(id=row["id"], render_hash=digest))
+    cache.set_many(fresh, AVATAR_RENDER_CACHE_TIMEOUT)
+    Avatar.objects.bulk_update(hashes, ["render_hash"])
+    return renders
+
+
+def get_avatar_renders(user_ids):
+    """
+    Render URLs of the given users' avatars as {user_id: {"hash", "url", "updated_at"}}.
+    Renders are content-addressed files in media storage; the cache maps each avatar's
+    `updated_at` and the catalog version to its file, so an edited avatar or catalog entry is
+    recomposed on its next request. At most AVATAR_RENDER_MAX_COMPOSE renders are composed
+    here; the others are left to compose_avatar_renders in Celery and map to None meanwhile.
+    """
+    from apps.avatar.models import Avatar
+    from apps.avatar.tasks import compose_avatar_renders as compose_later
+
+    version = catalog_version()
+    versions = dict(Avatar.objects.filter(user_id__in=user_ids).values_list("user_id", "updated_at"))
+    keys = {user_id: _render_key(user_id, updated_at, version) for user_id, updated_at in versions.items()}
+    cached = cache.get_many(keys.values())
+    renders = {user_id: cached.get(key) for user_id, key in keys.items()}
+
+    missing = [user_id for user_id, render in renders.items() if render is None]
+    if missing:
+        renders.update(compose_avatar_renders(missing[:AVATAR_RENDER_MAX_COMPOSE]))
+        if missing[AVATAR_RENDER_MAX_COMPOSE:]:
+            compose_later.delay(missing[AVATAR_RENDER_MAX_COMPOSE:])
+    return renders
+
+
+def prune_avatar_renders():
+    """
+    Delete render files that no avatar points to and that are older than
+    AVATAR_RENDER_RETENTION, so URLs handed out recently keep working. Returns the count.
+    """
+    from apps.avatar.models import Avatar
+
+    if not default_storage.exists(AVATAR_RENDER_DIR):
+        return 0
+    current = set(Avatar.objects.exclude(render_hash="").values_list("render_hash", flat=True))
+    cutoff = timezone.now() - AVATAR_RENDER_RETENTION
+    deleted = 0
+    for filename in default_storage.listdir(AVATAR_RENDER_DIR)[1]:
+        name = f"{AVATAR_RENDER_DIR}/{filename}"
+        if filename.removesuffix(".json") in current or default_storage.get_modified_time(name) > cutoff:
+            continue
+        default_storage.delete(name)
+        deleted += 1
+    return deleted
@@ -0,0 +1,20 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def compose_avatar_renders(user_ids):
+    from apps.avatar.services import compose_avatar_renders as compose
+
+    return len(compose(user_ids))
+
+
+@shared_task
+def prune_avatar_renders():
+    from apps.avatar.services import prune_avatar_renders as prune
+
+    deleted = prune()
+    logger.info("Deleted %s superseded avatar renders", deleted)
+    return deleted
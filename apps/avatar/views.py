@@ -1,8 +1,8 @@
-from django.db import transaction
 from django.db.models import Exists, OuterRef, Subquery
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
@@ -29,15 +29,79 @@ from apps.avatar.serializers import (
     UserUnlockedSkinColorSerializer,
 )
 from apps.avatar.permissions import AvatarPermissions
-from apps.blog.models import Notification
-from apps.users.models import CustomUser
-from apps.wallet.models import CoinLedgerEntry, CoinSpend
+from apps.avatar.services import (
+    catalog_etag,
+    etag_matches,
+    get_avatar_renders,
+    get_catalog,
+    get_owned_unlocks,
+    with_avatar_relations,
+)
+from apps.wallet.services import AlreadyOwned, CatalogItemNotFound, InsufficientCoins, spend_coins
+
+
+AVATAR_MAX_USER_IDS = 100
 
 
 class CatalogPagination(PageNumberPagination):
     page_size = 20
 
 
+def buy_catalog_item(request, target_type, not_found, already_owned, unlocked_key):
+    catalog_item_id = request.data.get("catalog_item_id")
+    if not catalog_item_id:
+        return Response({"detail": "catalog_item_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        catalog_item_id = int(catalog_item_id)
+    except (TypeError, ValueError):
+        return Response({"detail": "catalog_item_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        (unlocked,), coin_balance = spend_coins(request.user.pk, [(target_type, catalog_item_id)])
+    except CatalogItemNotFound:
+        return Response({"detail": not_found}, status=status.HTTP_404_NOT_FOUND)
+    except AlreadyOwned:
+        return Response({"detail": already_owned}, status=status.HTTP_409_CONFLICT)
+    except InsufficientCoins:
+        return Response(
+            {"detail": "Insufficient coins.", "code": "insufficient_coins"},
+            status=status.HTTP_402_PAYMENT_REQUIRED,
+        )
+
+    return Response({unlocked_key: unlocked.id, "coin_balance": coin_balance}, status=status.HTTP_201_CREATED)
+
+
+class CachedCatalogMixin:
+    """
+    Lists a catalog from the shared cache merged with the user's cached unlocks, owned first.
+    Responses carry an ETag over the catalog version and the user's unlocks as read from the
+    database, so unchanged catalogs revalidate with a 304.
+    """
+
+    catalog_kind = None
+    catalog_filters = ()  # (query param, row field)
+
+    def list(self, request, *args, **kwargs):
+        owned = get_owned_unlocks(request.user.pk)
+        etag = catalog_etag(request, owned)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        params = request.query_params
+        filters = [(field, params[param]) for param, field in self.catalog_filters if param in params]
+        owned_ids = owned[self.catalog_kind]
+        rows = [
+            {**row, "owned": row["id"] in owned_ids, "unlocked_item_id": owned_ids.get(row["id"])}
+            for row in get_catalog(self.catalog_kind)["rows"]
+            if all(row[field] == value for field, value in filters)
+        ]
+        rows.sort(key=lambda row: not row["owned"])
+
+        response = self.get_paginated_response(self.paginate_queryset(rows))
+        response["ETag"] = etag
+        return response
+
+
 class AvatarViewSet(viewsets.ModelViewSet):
     permission_classes = [AvatarPermissions]
     queryset = Avatar.objects.all()
@@ -46,6 +110,9 @@ class AvatarViewSet(viewsets.ModelViewSet):
         "user__id": ("exact",),
     }
 
+    def get_queryset(self):
+        return with_avatar_relations(Avatar.objects.order_by("id"))
+
     def get_serializer_class(self):
         if self.action in ["update", "partial_update"]:
             return AvatarUpdateSerializer
@@ -60,13 +127,41 @@ class AvatarViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"], url_path="my-avatar")
     def get_my_avatar(self, request):
         try:
-            avatar = Avatar.objects.get(user=request.user)
+            avatar = self.get_queryset().get(user=request.user)
         except Avatar.DoesNotExist:
             return Response({"detail": "Avatar not found."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = self.get_serializer(avatar)
         return Response(serializer.data)
 
+    def _requested_user_ids(self, request):
+        try:
+            user_ids = {int(user_id) for user_id in request.query_params.get("user_ids", "").split(",") if user_id}
+        except ValueError:
+            raise ParseError("user_ids must be comma-separated ids.")
+        if not user_ids:
+            raise ParseError("user_ids is required.")
+        if len(user_ids) > AVATAR_MAX_USER_IDS:
+            raise ParseError(f"At most {AVATAR_MAX_USER_IDS} user_ids per request.")
+        return user_ids
+
+    @action(detail=False, methods=["get"], url_path="bulk")
+    def bulk(self, request):
+        user_ids = self._requested_user_ids(request)
+        avatars = self.get_queryset().filter(user_id__in=user_ids)
+        return Response(self.get_serializer(avatars, many=True).data)
+
+    @action(detail=False, methods=["get"], url_path="renders")
+    def renders(self, request):
+        user_ids = self._requested_user_ids(request)
+        renders = get_avatar_renders(user_ids)
+        return Response(
+            {
+                str(user_id): {**render, "url": request.build_absolute_uri(render["url"])} if render else None
+                for user_id, render in renders.items()
+            }
+        )
+
     @action(detail=False, methods=["get"], url_path="user-avatar")
     def get_user_avatar(self, request):
         user_id = request.query_params.get("user_id")
@@ -74,7 +169,7 @@ class AvatarViewSet(viewsets.ModelViewSet):
             return Response({"detail": "user_id is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            avatar = Avatar.objects.get(user_id=user_id)
+            avatar = self.get_queryset().get(user_id=user_id)
         except Avatar.DoesNotExist:
             return Response({"detail": "Avatar not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -100,27 +195,31 @@ class UserUnlockedItemViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=["get"], url_path="grouped")
     def my_grouped(self, request):
-        qs = (
-            UserUnlockedItem.objects.filter(user=request.user)
-            .select_related("catalog_item")
-            .order_by("catalog_item__item_type", "catalog_item__code")
+        owned = get_owned_unlocks(request.user.pk)
+        etag = catalog_etag(request, owned)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        catalog = get_catalog("avatar_item")["by_id"]
+        items = sorted(
+            ((catalog[catalog_id], unlock_id) for catalog_id, unlock_id in owned["avatar_item"].items()),
+            key=lambda pair: (pair[0]["item_type"], pair[0]["code"]),
         )
 
         grouped = {key: [] for key, _ in UnlockedItemType.choices}
 
-        for row in qs:
-            item = row.catalog_item
-            grouped[item.item_type].append(
+        for item, unlock_id in items:
+            grouped[item["item_type"]].append(
                 {
-                    "code": item.code,
-                    "name": item.name,
-                    "svg": item.svg,
-                    "gender": item.avatar_type,
-                    "id": row.id,
+                    "code": item["code"],
+                    "name": item["name"],
+                    "svg": item["svg"],
+                    "gender": item["gender"],
+                    "id": unlock_id,
                 }
             )
 
-        return Response(grouped)
+        return Response(grouped, headers={"ETag": etag})
 
     @action(detail=False, methods=["get"], url_path="defaults")
     def defaults(self, request):
@@ -178,95 +277,37 @@ class UserUnlockedItemViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=["post"], url_path="buy-item")
     def buy_item(self, request):
-        catalog_item_id = request.data.get("catalog_item_id")
-        if not catalog_item_id:
-            return Response({"detail": "catalog_item_id is required."}, status=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            catalog_item = AvatarItemCatalog.objects.get(id=catalog_item_id, is_active=True)
-        except AvatarItemCatalog.DoesNotExist:
-            return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        with transaction.atomic():
-            user = CustomUser.objects.select_for_update().get(pk=request.user.pk)
-
-            if UserUnlockedItem.objects.filter(user=user, catalog_item=catalog_item).exists():
-                return Response({"detail": "Item already owned."}, status=status.HTTP_409_CONFLICT)
-
-            if user.coin_balance < catalog_item.price:
-                return Response(
-                    {"detail": "Insufficient coins.", "code": "insufficient_coins"},
-                    status=status.HTTP_402_PAYMENT_REQUIRED,
-                )
-
-            unlocked_item = UserUnlockedItem.objects.create(user=user, catalog_item=catalog_item)
-            spend = CoinSpend.objects.create(
-                user=user,
-                reason=CoinSpend.Reason.BUY_ITEM,
-                coins=catalog_item.price,
-                target_type="avatar_item",
-                target_id=str(catalog_item.id),
-            )
-            CoinLedgerEntry.objects.create(
-                user=user,
-                entry_type=CoinLedgerEntry.Type.DEBIT,
-                amount=catalog_item.price,
-                reference_id=f"spend:{spend.id}",
-                idempotency_key=f"spend:{spend.id}",
-            )
-            user.coin_balance -= catalog_item.price
-            user.save(update_fields=["coin_balance"])
-            Notification.objects.create(
-                user=user,
-                notification_type=Notification.Type.ITEM_PURCHASE,
-                metadata={
-                    "item_id": catalog_item.id,
-                    "item_name": catalog_item.name,
-                    "item_type": catalog_item.item_type,
-                    "avatar_type": catalog_item.avatar_type,
-                    "code": catalog_item.code,
-                    "svg": catalog_item.svg,
-                    "coins": catalog_item.price,
-                },
-            )
-
-        return Response(
-            {"unlocked_item_id": unlocked_item.id, "coin_balance": user.coin_balance},
-            status=status.HTTP_201_CREATED,
+        return buy_catalog_item(
+            request,
+            "avatar_item",
+            not_found="Item not found.",
+            already_owned="Item already owned.",
+            unlocked_key="unlocked_item_id",
         )
 
     @action(detail=False, methods=["get"], url_path="colors")
     def my_colors(self, request):
-        user = request.user
-        item_colors_qs = (
-            UserUnlockedColor.objects.filter(user=user).select_related("catalog_item").order_by("catalog_item__code")
-        )
-        skin_colors_qs = (
-            UserUnlockedSkinColor.objects.filter(user=user)
-            .select_related("catalog_item")
-            .order_by("catalog_item__code")
-        )
+        owned = get_owned_unlocks(request.user.pk)
+        etag = catalog_etag(request, owned)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        def owned_rows(kind):
+            catalog = get_catalog(kind)["by_id"]
+            rows = [{**catalog[catalog_id], "id": unlock_id} for catalog_id, unlock_id in owned[kind].items()]
+            for row in rows:
+                del row["price"]
+            return sorted(rows, key=lambda row: row["code"])
 
-        item_colors = [
-            {"code": row.catalog_item.code, "name": row.catalog_item.name, "hex": row.catalog_item.hex, "id": row.id}
-            for row in item_colors_qs
-        ]
-        skin_colors = [
-            {
-                "code": row.catalog_item.code,
-                "name": row.catalog_item.name,
-                "main_color": row.catalog_item.main_color,
-                "second_color": row.catalog_item.second_color,
-                "id": row.id,
-            }
-            for row in skin_colors_qs
-        ]
-
-        return Response({"item_colors": item_colors, "skin_colors": skin_colors})
+        return Response(
+            {"item_colors": owned_rows("item_color"), "skin_colors": owned_rows("skin_color")}, headers={"ETag": etag}
+        )
 
 
-class AvatarItemCatalogViewSet(viewsets.ReadOnlyModelViewSet):
+class AvatarItemCatalogViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
+    catalog_kind = "avatar_item"
+    catalog_filters = (("item_type", "item_type"), ("avatar_type", "gender"))
     serializer_class = AvatarItemCatalogSerializer
     pagination_class = CatalogPagination
     filterset_fields = {
@@ -302,59 +343,12 @@ class UserUnlockedColorViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=["post"], url_path="buy-color")
     def buy_color(self, request):
-        catalog_item_id = request.data.get("catalog_item_id")
-        if not catalog_item_id:
-            return Response({"detail": "catalog_item_id is required."}, status=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            catalog_item = AvatarColorCatalog.objects.get(id=catalog_item_id, is_active=True)
-        except AvatarColorCatalog.DoesNotExist:
-            return Response({"detail": "Color not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        with transaction.atomic():
-            user = CustomUser.objects.select_for_update().get(pk=request.user.pk)
-
-            if UserUnlockedColor.objects.filter(user=user, catalog_item=catalog_item).exists():
-                return Response({"detail": "Color already owned."}, status=status.HTTP_409_CONFLICT)
-
-            if user.coin_balance < catalog_item.price:
-                return Response(
-                    {"detail": "Insufficient coins.", "code": "insufficient_coins"},
-                    status=status.HTTP_402_PAYMENT_REQUIRED,
-                )
-
-            unlocked_color = UserUnlockedColor.objects.create(user=user, catalog_item=catalog_item)
-            spend = CoinSpend.objects.create(
-                user=user,
-                reason=CoinSpend.Reason.BUY_COLOR,
-                coins=catalog_item.price,
-                target_type="item_color",
-                target_id=str(catalog_item.id),
-            )
-            CoinLedgerEntry.objects.create(
-                user=user,
-                entry_type=CoinLedgerEntry.Type.DEBIT,
-                amount=catalog_item.price,
-                reference_id=f"spend:{spend.id}",
-                idempotency_key=f"spend:{spend.id}",
-            )
-            user.coin_balance -= catalog_item.price
-            user.save(update_fields=["coin_balance"])
-            Notification.objects.create(
-                user=user,
-                notification_type=Notification.Type.COLOR_PURCHASE,
-                metadata={
-                    "color_id": catalog_item.id,
-                    "color_name": catalog_item.name,
-                    "hex": catalog_item.hex,
-                    "coins": catalog_item.price,
-                    "color_type": "item_color",
-                },
-            )
-
-        return Response(
-            {"unlocked_color_id": unlocked_color.id, "coin_balance": user.coin_balance},
-            status=status.HTTP_201_CREATED,
+        return buy_catalog_item(
+            request,
+            "item_color",
+            not_found="Color not found.",
+            already_owned="Color already owned.",
+            unlocked_key="unlocked_color_id",
         )
 
 
@@ -371,64 +365,18 @@ class UserUnlockedSkinColorViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=["post"], url_path="buy-color")
     def buy_color(self, request):
-        catalog_item_id = request.data.get("catalog_item_id")
-        if not catalog_item_id:
-            return Response({"detail": "catalog_item_id is required."}, status=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            catalog_item = AvatarSkinColorCatalog.objects.get(id=catalog_item_id, is_active=True)
-        except AvatarSkinColorCatalog.DoesNotExist:
-            return Response({"detail": "Skin color not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        with transaction.atomic():
-            user = CustomUser.objects.select_for_update().get(pk=request.user.pk)
-
-            if UserUnlockedSkinColor.objects.filter(user=user, catalog_item=catalog_item).exists():
-                return Response({"detail": "Skin color already owned."}, status=status.HTTP_409_CONFLICT)
-
-            if user.coin_balance < catalog_item.price:
-                return Response(
-                    {"detail": "Insufficient coins.", "code": "insufficient_coins"},
-                    status=status.HTTP_402_PAYMENT_REQUIRED,
-                )
-
-            unlocked_skin_color = UserUnlockedSkinColor.objects.create(user=user, catalog_item=catalog_item)
-            spend = CoinSpend.objects.create(
-                user=user,
-                reason=CoinSpend.Reason.BUY_COLOR,
-                coins=catalog_item.price,
-                target_type="skin_color",
-                target_id=str(catalog_item.id),
-            )
-            CoinLedgerEntry.objects.create(
-                user=user,
-                entry_type=CoinLedgerEntry.Type.DEBIT,
-                amount=catalog_item.price,
-                reference_id=f"spend:{spend.id}",
-                idempotency_key=f"spend:{spend.id}",
-            )
-            user.coin_balance -= catalog_item.price
-            user.save(update_fields=["coin_balance"])
-            Notification.objects.create(
-                user=user,
-                notification_type=Notification.Type.COLOR_PURCHASE,
-                metadata={
-                    "color_id": catalog_item.id,
-                    "color_name": catalog_item.name,
-                    "main_color": catalog_item.main_color,
-                    "coins": catalog_item.price,
-                    "color_type": "skin_color",
-                },
-            )
-
-        return Response(
-            {"unlocked_skin_color_id": unlocked_skin_color.id, "coin_balance": user.coin_balance},
-            status=status.HTTP_201_CREATED,
+        return buy_catalog_item(
+            request,
+            "skin_color",
+            not_found="Skin color not found.",
+            already_owned="Skin color already owned.",
+            unlocked_key="unlocked_skin_color_id",
         )
 
 
-class AvatarColorCatalogViewSet(viewsets.ReadOnlyModelViewSet):
+class AvatarColorCatalogViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
+    catalog_kind = "item_color"
     serializer_class = AvatarColorCatalogSerializer
     pagination_class = CatalogPagination
 
@@ -447,8 +395,9 @@ class AvatarColorCatalogViewSet(viewsets.ReadOnlyModelViewSet):
         )
 
 
-class AvatarSkinColorCatalogViewSet(viewsets.ReadOnlyModelViewSet):
+class AvatarSkinColorCatalogViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
+    catalog_kind = "skin_color"
     serializer_class = AvatarSkinColorCatalogSerializer
     pagination_class = CatalogPagination
 
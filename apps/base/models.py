@@ -1,9 +1,10 @@
 from django.db import models
 from django.dispatch import receiver
 from django.utils.text import slugify
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from ckeditor.fields import RichTextField
 
+from .services import invalidate_topic_tree
 from .tasks import send_info_emails
 from apps.users.models import CustomUser
 
@@ -93,3 +94,11 @@ class EmailSending(models.Model):
 def send_email_on_create(sender, instance, created, **kwargs):
     if created:
         instance.send_emails()
+
+
+@receiver(post_save, sender=TopicTag)
+@receiver(post_delete, sender=TopicTag)
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def invalidate_topic_tree_on_change(sender, instance, **kwargs):
+    invalidate_topic_tree()
@@ -2,7 +2,8 @@ from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
 
 from .models import TopicTag, Topic, SoftSkill, Mentor
-from apps.blog.models import Like, Card, UserCardView
+from .services import soft_skill_progress
+from apps.blog.models import Like
 from apps.spaces.models import Space
 from apps.users.utils import get_user_level
 from xloserver.constants import get_level
@@ -95,14 +96,9 @@ class SoftSkillSerializerDetails(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_cards_viewed_percentage(self, obj):
-        user_id = self.context["request"].user.id
-        total_cards = Card.objects.filter(soft_skill=obj).count()
-        cards_seen_count = UserCardView.objects.filter(user=user_id, card__soft_skill=obj).count()
-
-        if total_cards > 0:
-            percentage = (cards_seen_count / total_cards) * 100
-            return round(percentage, 2)
-        return 0
+        if "soft_skill_progress" not in self.context:
+            self.context["soft_skill_progress"] = soft_skill_progress(self.context["request"].user.id)
+        return self.context["soft_skill_progress"].get(obj.id, 0)
 
 
 class MentorSerializer(serializers.ModelSerializer):
@@ -0,0 +1,234 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+
+
+PLATFORM_STATS_CACHE_KEY = "platform:stats"
+
+TOPIC_TREE_VERSION_KEY = "base:topic_tree_version"
+# Story counts in the tree may lag by up to this long; topic and tag edits show at once.
+TOPIC_TREE_CACHE_TIMEOUT = 60 * 5
+
+SOFT_SKILL_CARD_COUNTS_KEY = "base:soft_skill_card_counts"
+SOFT_SKILL_CARD_COUNTS_CACHE_TIMEOUT = 60 * 60
+
+
+def _platform_counters():
+    """Stat name -> (queryset to count, whether a table-wide estimate can stand in for it)."""
+    from apps.assessments.models import Assessment
+    from apps.attempts.models import Attempt
+    from apps.blog.models import Comment, Story
+    from apps.users.models import CustomUser
+
+    return {
+        "total_attempts": (Attempt.objects.all(), True),
+        "total_assessments": (Assessment.objects.filter(is_active=True), False),
+        "total_stories": (Story.objects.filter(is_active=True), False),
+        "total_users": (CustomUser.objects.all(), True),
+        "total_comments": (Comment.objects.filter(is_active=True), False),
+    }
+
+
+def estimated_row_counts(models):
+    """
+    Planner row estimates (`pg_class.reltuples`) of the models' tables, in one query. Tables
+    never analyzed report -1 and are left out.
+    """
+    tables = {model._meta.db_table: model for model in models}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relname = ANY(%s)", [list(tables)]
+        )
+        return {tables[name]: int(estimate) for name, estimate in cursor.fetchall() if estimate >= 0}
+
+
+def compute_platform_stats(estimate=None):
+    """
+    Count the platform totals. With `estimate` (default: the PLATFORM_STATS_ESTIMATE_COUNTS
+    setting) unfiltered totals come from the planner statistics instead of a full count.
+    """
+    if estimate is None:
+        estimate = settings.PLATFORM_STATS_ESTIMATE_COUNTS
+    counters = _platform_counters()
+    estimates = {}
+    if estimate:
+        estimates = estimated_row_counts([queryset.model for queryset, estimable in counters.values() if estimable])
+
+    stats = {}
+    for name, (queryset, estimable) in counters.items():
+        if estimable and queryset.model in estimates:
+            stats[name] = estimates[queryset.model]
+        else:
+            stats[name] = queryset.count()
+    stats["estimated"] = bool(estimates)
+    stats["updated_at"] = timezone.now().isoformat()
+    return stats
+
+
+def refresh_platform_stats():
+    stats = compute_platform_stats()
+    cache.set(PLATFORM_STATS_CACHE_KEY, stats, settings.PLATFORM_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def get_platform_stats():
+    """Cached platform totals; refreshed by the beat task and recomputed here only on a miss."""
+    return cache.get_or_set(PLATFORM_STATS_CACHE_KEY, compute_platform_stats, settings.PLATFORM_STATS_CACHE_TIMEOUT)
+
+
+def topic_tree_version():
+    return cache.get_or_set(TOPIC_TREE_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_topic_tree():
+    """Retire the cached trees of every scope; the entries under the old version simply expire."""
+    cache.set(TOPIC_TREE_VERSION_KEY, time.time_ns(), None)
+
+
+def build_topic_tree(space_id=None):
+    """
+    Tags with their topics and public story counts, for everyone or for the tags of one
+    space, in three queries: tags, prefetched topics and story counts grouped by topic. For a
+    space, `space_story_counts` also holds the counts of the stories shared to it.
+    """
+    from apps.base.models import Topic, TopicTag
+    from apps.blog.models import Story
+
+    tags = TopicTag.objects.order_by("id").prefetch_related(
+        Prefetch("topic_set", queryset=Topic.objects.order_by("id"))
+    )
+    if space_id:
+        tags = tags.filter(spaces__id=space_id).distinct()
+    tags = list(tags)
+    topic_ids = [topic.id for tag in tags for topic in tag.topic_set.all()]
+
+    def story_counts(stories):
+        return dict(
+            stories.filter(topic_id__in=topic_ids)
+            .values("topic_id")
+            .annotate(n=Count("id", distinct=True))
+            .values_list("topic_id", "n")
+        )
+
+    public_counts = story_counts(Story.objects.filter(is_private=False)) if topic_ids else {}
+    tree = {
+        "tags": [
+            {
+                "id": tag.id,
+                "name": tag.name,
+                "color": tag.color,
+                "topic_count": len(tag.topic_set.all()),
+                "topics": [
+                    {
+                        "id": topic.id,
+                        "title": topic.title,
+                        "image": topic.image.url if topic.image else None,
+                        "slug": topic.slug,
+                        "story_count": public_counts.get(topic.id, 0),
+                    }
+                    for topic in tag.topic_set.all()
+                ],
+            }
+            for tag in tags
+        ],
+        "space_story_counts": {},
+    }
+    if space_id and topic_ids:
+        tree["space_story_counts"] = story_counts(Story.objects.filter(spaces__id=space_id))
+    return tree
+
+
+def get_topic_tree(space_id=None):
+    """The public or space tree from the cache. Trees of unknown spaces are built but never cached."""
+    from apps.spaces.models import Space
+
+    scope = f"space:{space_id}" if space_id else "public"
+    key = f"base:topic_tree:{topic_tree_version()}:{scope}"
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_topic_tree(space_id)
+        if not space_id or Space.objects.filter(pk=space_id).exists():
+            cache.set(key, tree, TOPIC_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def topic_tree_for(request, space_id=None):
+    """
+    The cached tree with the viewer's overlay merged in: `user_has_liked` (the like id or
+    False) from one query over the viewer's likes, space story counts for space members,
+    and absolute image URLs. Serialized like TopicTagSerializer.
+    """
+    from apps.base.models import Topic
+    from apps.blog.models import Like
+    from apps.spaces.models import Space
+    from django.contrib.contenttypes.models import ContentType
+
+    tree = get_topic_tree(space_id)
+    topic_content_type_id = ContentType.objects.get_for_model(Topic).id
+    liked = {}
+    user = request.user
+    if user.is_authenticated:
+        topic_ids = [topic["id"] for tag in tree["tags"] for topic in tag["topics"]]
+        liked = dict(
+            Like.objects.filter(
+                user=user, content_type_id=topic_content_type_id, object_id__in=topic_ids, is_active=True
+            ).values_list("object_id", "id")
+        )
+    space_counts = tree["space_story_counts"] if space_id and Space.user_is_member(user, space_id) else None
+
+    def topic_row(topic):
+        row = {**topic, "user_has_liked": liked.get(topic["id"], False)}
+        if row["image"]:
+            row["image"] = request.build_absolute_uri(row["image"])
+        if space_counts is not None:
+            row["story_count"] = space_counts.get(topic["id"], 0)
+        return row
+
+    return [
+        {**tag, "topics": [topic_row(topic) for topic in tag["topics"]], "topic_content_type_id": topic_content_type_id}
+        for tag in tree["tags"]
+    ]
+
+
+def soft_skill_card_counts():
+    """Number of cards of every soft skill as {soft_skill_id: count}, shared by all users."""
+
+    def load():
+        from apps.blog.models import Card
+
+        return dict(
+            Card.objects.filter(soft_skill__isnull=False)
+            .values("soft_skill_id")
+            .annotate(n=Count("id"))
+            .values_list("soft_skill_id", "n")
+        )
+
+    return cache.get_or_set(SOFT_SKILL_CARD_COUNTS_KEY, load, SOFT_SKILL_CARD_COUNTS_CACHE_TIMEOUT)
+
+
+def invalidate_soft_skill_card_counts():
+    transaction.on_commit(lambda: cache.delete(SOFT_SKILL_CARD_COUNTS_KEY))
+
+
+def soft_skill_progress(user_id):
+    """
+    Percentage of the cards of every soft skill the user has viewed, as {soft_skill_id: pct}.
+    One query grouping the user's card views by soft skill; the totals come from the cache.
+    """
+    from apps.blog.models import UserCardView
+
+    viewed = dict(
+        UserCardView.objects.filter(user_id=user_id, card__soft_skill__isnull=False)
+        .values("card__soft_skill_id")
+        .annotate(n=Count("id"))
+        .values_list("card__soft_skill_id", "n")
+    )
+    return {
+        soft_skill_id: round(viewed.get(soft_skill_id, 0) / total * 100, 2)
+        for soft_skill_id, total in soft_skill_card_counts().items()
+        if total
+    }
@@ -18,3 +18,10 @@ def send_info_emails(subject, body, template):
         template_name = TEMPLATES_MAPPING.get(template, "send_info_email_username.html")
         html_message = render_to_string(template_name, {"greeting_name": greeting_name, "body": body})
         send_mail(subject, "", from_email, [user.email], html_message=html_message)
+
+
+@shared_task
+def refresh_platform_stats():
+    from apps.base.services import refresh_platform_stats as refresh
+
+    return refresh()
@@ -2,6 +2,7 @@ from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
 from rest_framework import viewsets, generics, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -17,6 +18,7 @@ from .serializers import (
     ContentTypeSerializer,
 )
 from .permissions import MentorPermissions
+from .services import soft_skill_progress, topic_tree_for
 from apps.users.utils import get_user_level
 from xloserver.constants import get_level
 
@@ -50,6 +52,35 @@ class TopicTagsViewSet(viewsets.ReadOnlyModelViewSet):
             context["space_id"] = space_id
         return context
 
+    def _topic_tree(self, request):
+        space_id = request.query_params.get("space_id")
+        try:
+            space_id = int(space_id) if space_id else None
+        except ValueError:
+            raise ParseError("space_id must be an id.")
+        return topic_tree_for(request, space_id)
+
+    def list(self, request, *args, **kwargs):
+        tags = self._topic_tree(request)
+        name = request.query_params.get("name")
+        if name is not None:
+            tags = [tag for tag in tags if tag["name"] == name]
+        name_contains = request.query_params.get("name__icontains")
+        if name_contains is not None:
+            tags = [tag for tag in tags if name_contains.lower() in tag["name"].lower()]
+        return self.get_paginated_response(self.paginate_queryset(tags))
+
+    def retrieve(self, request, *args, **kwargs):
+        tag = next((tag for tag in self._topic_tree(request) if str(tag["id"]) == kwargs["pk"]), None)
+        if tag is None:
+            raise NotFound()
+        return Response(tag)
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        """Every tag with its topics, unpaginated."""
+        return Response(self._topic_tree(request))
+
 
 class TopicsViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Topic.objects.all().order_by("id")
@@ -82,7 +113,8 @@ class SoftSkillsViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=["get"])
     def detailed_list(self, request):
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = SoftSkillSerializerDetails(queryset, many=True, context={"request": request})
+        context = {"request": request, "soft_skill_progress": soft_skill_progress(request.user.id)}
+        serializer = SoftSkillSerializerDetails(queryset, many=True, context=context)
         return Response(serializer.data)
 
 
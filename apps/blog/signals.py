@@ -1,8 +1,9 @@
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 
-from .models import Comment, Notification, Like
+from .models import Card, Comment, Notification, Like
+from apps.base.services import invalidate_soft_skill_card_counts
 
 
 @receiver(post_delete, sender=Comment)
@@ -17,3 +18,9 @@ def delete_like_notifications(sender, instance, **kwargs):
     Notification.objects.filter(
         content_type=ContentType.objects.get_for_model(instance), object_id=instance.id
     ).delete()
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+def invalidate_soft_skill_card_counts_on_change(sender, instance, **kwargs):
+    invalidate_soft_skill_card_counts()
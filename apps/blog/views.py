@@ -60,6 +60,7 @@ from .tasks import send_like_email, send_new_stories_email, send_ask_for_help_em
 from .filters import UserOwnedFilterBackend
 from apps.base.models import Topic
 from apps.spaces.models import Space
+from apps.spaces.services import visible_in_spaces
 from apps.users.utils import award_activity_points
 
 
@@ -135,13 +136,13 @@ class StoriesViewSet(viewsets.ModelViewSet):
         space_id = self.request.query_params.get("spaces")
         if space_id:
             if Space.user_is_member(user, space_id):
-                return queryset.filter(spaces__id=space_id).distinct()
+                return queryset.filter(spaces__id=space_id)
 
         if user.is_authenticated:
             visibility = Q(is_private=False) | Q(user=user)
             if self.action in ("retrieve", "find_by_slug"):
-                visibility |= Q(spaces__owner=user) | Q(spaces__admins=user) | Q(spaces__members=user)
-            queryset = queryset.filter(visibility).distinct()
+                visibility |= Q(visible_in_spaces(user, Story.spaces.through, "story"))
+            queryset = queryset.filter(visibility)
         else:
             queryset = queryset.filter(is_private=False, free_access=True)
 
@@ -1,11 +1,12 @@
 from django.contrib import admin
 
-from .models import Space, MembershipRequest
+from .models import Space, SpaceMembership, MembershipRequest
 
 
 @admin.register(Space)
 class SpaceAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "owner", "access_type", "created_time")
+    list_display = ("id", "name", "owner", "access_type", "members_count", "admins_count", "created_time")
+    readonly_fields = ("members_count", "admins_count")
     search_fields = ("name",)
     list_per_page = 100
 
@@ -16,3 +17,13 @@ class MembershipRequestAdmin(admin.ModelAdmin):
     list_filter = ("space", "status")
     search_fields = ("space",)
     list_per_page = 100
+
+
+@admin.register(SpaceMembership)
+class SpaceMembershipAdmin(admin.ModelAdmin):
+    list_display = ("id", "space", "user", "role", "created_time")
+    list_filter = ("role",)
+    search_fields = ("space__name", "user__email")
+    list_select_related = ("space", "user")
+    readonly_fields = ("space", "user", "role", "created_time")
+    list_per_page = 100
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.6 on 2026-10-19 02:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('spaces', '0004_alter_space_access_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='admins_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='space',
+            name='members_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SpaceMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('admin', 'Admin'), ('member', 'Member')], max_length=10)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('space', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='spaces.space')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='space_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'role'], name='spaces_spac_user_id_bacd04_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='spacemembership',
+            constraint=models.UniqueConstraint(fields=('space', 'user'), name='uq_space_membership_space_user'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-19 02:55
+
+from django.db import migrations
+
+
+def populate_memberships(apps, schema_editor):
+    Space = apps.get_model("spaces", "Space")
+    SpaceMembership = apps.get_model("spaces", "SpaceMembership")
+
+    for space in Space.objects.all():
+        admin_ids = set(space.admins.values_list("id", flat=True)) - {space.owner_id}
+        member_ids = set(space.members.values_list("id", flat=True)) - admin_ids - {space.owner_id}
+        memberships = [SpaceMembership(space=space, user_id=uid, role="admin") for uid in admin_ids]
+        memberships += [SpaceMembership(space=space, user_id=uid, role="member") for uid in member_ids]
+        SpaceMembership.objects.bulk_create(memberships, ignore_conflicts=True)
+        space.admins_count = len(admin_ids)
+        space.members_count = len(member_ids)
+        space.save(update_fields=["admins_count", "members_count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaces", "0005_space_counts_spacemembership"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_memberships, reverse_code=migrations.RunPython.noop),
+    ]
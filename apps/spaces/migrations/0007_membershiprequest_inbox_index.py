@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-19 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spaces', '0006_populate_space_memberships'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='membershiprequest',
+            index=models.Index(fields=['space', 'request_type', 'status'], name='spaces_memb_space_i_769a4f_idx'),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.utils.text import slugify
 
 from apps.users.models import ProfileColor, CustomUser
 from apps.base.models import TopicTag
+from .services import get_visible_space_ids
 
 
 class Space(models.Model):
@@ -24,6 +25,8 @@ class Space(models.Model):
     updated_time = models.DateTimeField(auto_now=True)
     categories = models.ManyToManyField(TopicTag, related_name="spaces", blank=True)
     slug = models.SlugField(max_length=320, blank=True, unique=True)
+    members_count = models.PositiveIntegerField(default=0)
+    admins_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -41,16 +44,66 @@ class Space(models.Model):
                 self.slug = f"{original_slug}-{count}"
         super(Space, self).save(*args, **kwargs)
 
+    @property
+    def total_members_count(self):
+        """Owner, admins and members, each user counted once."""
+        return self.members_count + self.admins_count + 1
+
+    def get_user_role(self, user):
+        """
+        Role of `user` in this space: "owner", "admin", "member" or None.
+        Memoized per instance, so serializers can ask several role questions for one query.
+        """
+        if not user or not user.is_authenticated:
+            return None
+        if self.owner_id == user.id:
+            return SpaceMembership.Role.OWNER
+
+        roles = self.__dict__.setdefault("_user_roles", {})
+        if user.id not in roles:
+            roles[user.id] = (
+                SpaceMembership.objects.filter(space_id=self.pk, user_id=user.id).values_list("role", flat=True).first()
+            )
+        return roles[user.id]
+
     @classmethod
     def user_is_member(cls, user, space_id):
         """Whether `user` is the owner, an admin, or a member of the space with this id."""
-        if not user or not user.is_authenticated:
+        try:
+            space_id = int(space_id)
+        except (TypeError, ValueError):
             return False
-        return (
-            cls.objects.filter(id=space_id)
-            .filter(models.Q(owner=user) | models.Q(admins=user) | models.Q(members=user))
-            .exists()
-        )
+        return space_id in get_visible_space_ids(user)
+
+
+class SpaceMembership(models.Model):
+    """
+    One row per (space, user) mirroring the `admins` and `members` relations, so role checks
+    are a single unique-index lookup. Maintained by the m2m_changed handlers in signals.py;
+    the owner is resolved from `Space.owner` and never stored here.
+    """
+
+    class Role(models.TextChoices):
+        OWNER = "owner", "Owner"
+        ADMIN = "admin", "Admin"
+        MEMBER = "member", "Member"
+
+    space = models.ForeignKey(Space, on_delete=models.CASCADE, related_name="memberships")
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="space_memberships")
+    role = models.CharField(max_length=10, choices=Role.choices)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["space", "user"], name="uq_space_membership_space_user"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "role"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.space} ({self.role})"
+
 
 class MembershipRequest(models.Model):
     REQUEST_TYPE_CHOICES = [
@@ -65,3 +118,8 @@ class MembershipRequest(models.Model):
         max_length=10, choices=[("pending", "Pending"), ("approved", "Approved"), ("rejected", "Rejected")]
     )
     created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["space", "request_type", "status"]),
+        ]
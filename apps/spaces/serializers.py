@@ -1,7 +1,8 @@
 from rest_framework import serializers
 
 from apps.base.models import TopicTag
-from .models import Space, MembershipRequest
+from apps.users.serializers import UserDetailSerializer
+from .models import Space, SpaceMembership, MembershipRequest
 
 
 class SpaceSerializer(serializers.ModelSerializer):
@@ -48,15 +49,10 @@ class SpaceSerializer(serializers.ModelSerializer):
         return space
 
     def get_members_count(self, obj):
-        member_ids = set(obj.members.values_list('id', flat=True))
-        admin_ids = set(obj.admins.values_list('id', flat=True))
-        member_ids.update(admin_ids)
-        member_ids.add(obj.owner_id)
-        return len(member_ids)
+        return obj.total_members_count
 
     def get_is_member(self, obj):
-        user = self.context["request"].user
-        return user == obj.owner or user in obj.admins.all() or user in obj.members.all()
+        return obj.get_user_role(self.context["request"].user) is not None
 
     def get_has_membership_request(self, obj):
         user = self.context["request"].user
@@ -104,15 +100,13 @@ class SpaceDetailSerializer(serializers.ModelSerializer):
 
     def get_is_owner(self, obj):
         user = self.context["request"].user
-        return user.id == obj.owner.id
+        return user.id == obj.owner_id
 
     def get_is_member(self, obj):
-        user = self.context["request"].user
-        return user == obj.owner or user in obj.admins.all() or user in obj.members.all()
+        return obj.get_user_role(self.context["request"].user) is not None
 
     def get_is_admin(self, obj):
-        user = self.context["request"].user
-        return user in obj.admins.all()
+        return obj.get_user_role(self.context["request"].user) == SpaceMembership.Role.ADMIN
 
     def get_members_count(self, obj):
         return obj.members.count()
@@ -142,6 +136,16 @@ class MembershipRequestInvitationSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class MembershipRequestInboxSerializer(serializers.ModelSerializer):
+    space_name = serializers.ReadOnlyField(source="space.name")
+    space_slug = serializers.ReadOnlyField(source="space.slug")
+    user = UserDetailSerializer(read_only=True)
+
+    class Meta:
+        model = MembershipRequest
+        fields = ("id", "space", "space_name", "space_slug", "user", "status", "created_time")
+
+
 class MembershipRequestUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = MembershipRequest
@@ -0,0 +1,137 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Greatest
+
+
+def sync_memberships(space_id, owner_id, user_ids):
+    """
+    Recompute the SpaceMembership rows of `user_ids` in one space from the `admins` and
+    `members` relations, and shift the stored counts on Space by the resulting delta.
+    Admin wins over member when a user is in both; the owner is never stored.
+    """
+    from apps.spaces.models import Space, SpaceMembership
+
+    user_ids = set(user_ids) - {owner_id}
+    if not user_ids:
+        return
+
+    Role = SpaceMembership.Role
+    with transaction.atomic():
+        admin_ids = set(
+            Space.admins.through.objects.filter(space_id=space_id, customuser_id__in=user_ids).values_list(
+                "customuser_id", flat=True
+            )
+        )
+        member_ids = (
+            set(
+                Space.members.through.objects.filter(space_id=space_id, customuser_id__in=user_ids).values_list(
+                    "customuser_id", flat=True
+                )
+            )
+            - admin_ids
+        )
+
+        before = dict(
+            SpaceMembership.objects.filter(space_id=space_id, user_id__in=user_ids).values_list("user_id", "role")
+        )
+        after = {uid: Role.ADMIN for uid in admin_ids}
+        after.update({uid: Role.MEMBER for uid in member_ids})
+
+        removed = [uid for uid in before if uid not in after]
+        if removed:
+            SpaceMembership.objects.filter(space_id=space_id, user_id__in=removed).delete()
+        changed = [
+            SpaceMembership(space_id=space_id, user_id=uid, role=role)
+            for uid, role in after.items()
+            if before.get(uid) != role
+        ]
+        if changed:
+            SpaceMembership.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=["space", "user"], update_fields=["role"]
+            )
+
+        def delta(role):
+            return sum(1 for r in after.values() if r == role) - sum(1 for r in before.values() if r == role)
+
+        members_delta, admins_delta = delta(Role.MEMBER), delta(Role.ADMIN)
+        if members_delta or admins_delta:
+            Space.objects.filter(pk=space_id).update(
+                members_count=Greatest(F("members_count") + members_delta, 0),
+                admins_count=Greatest(F("admins_count") + admins_delta, 0),
+            )
+
+        touched = set(removed) | {m.user_id for m in changed}
+        if touched:
+            # Again on commit, in case a concurrent reader re-cached the old set meanwhile.
+            invalidate_visible_spaces(touched)
+            transaction.on_commit(lambda: invalidate_visible_spaces(touched))
+
+
+def sync_owner_change(space_id, owner_id, previous_owner_id):
+    """
+    Bring the SpaceMembership rows and stored counts of a space in line with a new owner: the
+    new owner's row is dropped, as owners are never stored, and the previous owner's row is
+    recomputed from the `admins` and `members` relations.
+    """
+    from apps.spaces.models import Space, SpaceMembership
+
+    with transaction.atomic():
+        owner_membership = SpaceMembership.objects.filter(space_id=space_id, user_id=owner_id)
+        role = owner_membership.values_list("role", flat=True).first()
+        if role:
+            owner_membership.delete()
+            counter = "admins_count" if role == SpaceMembership.Role.ADMIN else "members_count"
+            Space.objects.filter(pk=space_id).update(**{counter: Greatest(F(counter) - 1, 0)})
+        sync_memberships(space_id, owner_id, [previous_owner_id])
+
+
+VISIBLE_SPACES_CACHE_TIMEOUT = 60 * 5  # 5 min; invalidated early when memberships change
+
+
+def visible_spaces_cache_key(user_id):
+    return f"spaces:visible:{user_id}"
+
+
+def get_visible_space_ids(user):
+    """
+    Ids of the spaces `user` owns, administers or belongs to. Computed with one query and
+    cached per user, so private-content filters can use `spaces__id__in` instead of joining
+    the owner, admins and members relations.
+    """
+    from apps.spaces.models import Space, SpaceMembership
+
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    def compute():
+        owned = Space.objects.filter(owner_id=user.id).values_list("id", flat=True)
+        joined = SpaceMembership.objects.filter(user_id=user.id).values_list("space_id", flat=True)
+        return frozenset(owned.union(joined))
+
+    return cache.get_or_set(visible_spaces_cache_key(user.id), compute, VISIBLE_SPACES_CACHE_TIMEOUT)
+
+
+def invalidate_visible_spaces(user_ids):
+    cache.delete_many([visible_spaces_cache_key(user_id) for user_id in user_ids])
+
+
+def visible_in_spaces(user, through_model, source_field):
+    """
+    Exists() condition matching rows linked through `through_model` to a space `user` can see,
+    e.g. `visible_in_spaces(user, Story.spaces.through, "story")`. Never matches for users
+    without spaces.
+    """
+    space_ids = get_visible_space_ids(user)
+    return Exists(through_model.objects.filter(**{source_field: OuterRef("pk"), "space_id__in": space_ids}))
+
+
+def administered_spaces(user):
+    """
+    Ids of the spaces `user` owns or administers, as a subquery for `space__in` filters. Unlike
+    joining `space__admins`, it cannot duplicate the outer rows, so no `distinct()` is needed.
+    """
+    from apps.spaces.models import Space, SpaceMembership
+
+    is_admin = SpaceMembership.objects.filter(space=OuterRef("pk"), user_id=user.id, role=SpaceMembership.Role.ADMIN)
+    return Space.objects.filter(Q(owner_id=user.id) | Q(Exists(is_admin))).values("id")
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from apps.base.services import invalidate_topic_tree
+from .models import Space, SpaceMembership
+from .services import sync_memberships, sync_owner_change, invalidate_visible_spaces
+
+
+@receiver(m2m_changed, sender=Space.admins.through)
+@receiver(m2m_changed, sender=Space.members.through)
+def sync_space_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # pk_set is not provided on clear, so remember who is about to be removed.
+        if reverse:
+            rows = sender.objects.filter(customuser_id=instance.pk).values_list("space_id", flat=True)
+        else:
+            rows = sender.objects.filter(space_id=instance.pk).values_list("customuser_id", flat=True)
+        instance._cleared_pks = set(rows)
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_pks", set())
+    elif action not in ("post_add", "post_remove"):
+        return
+
+    if not pk_set:
+        return
+    if reverse:
+        for space_id, owner_id in Space.objects.filter(pk__in=pk_set).values_list("id", "owner_id"):
+            sync_memberships(space_id, owner_id, [instance.pk])
+    else:
+        sync_memberships(instance.pk, instance.owner_id, pk_set)
+
+
+@receiver(pre_save, sender=Space)
+def remember_previous_owner(sender, instance, **kwargs):
+    instance._previous_owner_id = (
+        Space.objects.filter(pk=instance.pk).values_list("owner_id", flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Space)
+def sync_space_owner(sender, instance, **kwargs):
+    previous_owner_id = getattr(instance, "_previous_owner_id", None)
+    if previous_owner_id and previous_owner_id != instance.owner_id:
+        sync_owner_change(instance.pk, instance.owner_id, previous_owner_id)
+    owner_ids = {instance.owner_id, previous_owner_id} - {None}
+    invalidate_visible_spaces(owner_ids)
+    transaction.on_commit(lambda: invalidate_visible_spaces(owner_ids))
+
+
+@receiver(pre_delete, sender=Space)
+def invalidate_space_users_visible_spaces(sender, instance, **kwargs):
+    user_ids = list(SpaceMembership.objects.filter(space=instance).values_list("user_id", flat=True))
+    invalidate_visible_spaces(user_ids + [instance.owner_id])
+
+
+@receiver(m2m_changed, sender=Space.categories.through)
+def invalidate_topic_tree_on_space_categories_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_topic_tree()
@@ -1,18 +1,45 @@
+import smtplib
+
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.utils.log import get_task_logger
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 
 FROM_EMAIL_TEXT = "Mixelo Invitations <contact@mixelo.io>"
+INVITATION_EMAIL_BATCH_SIZE = 100
+
+logger = get_task_logger(__name__)
 
 
 @shared_task
-def send_space_invitation_email(emails, space_name, space_slug):
+def send_space_invitation_email(emails, space_name, space_slug, batch_number=1, batch_count=1):
+    """
+    Send one batch of space invitations over a single SMTP connection.
+    Returns the batch progress so callers can follow a multi-batch invite.
+    """
     subject = f"Invitation to join {space_name} on Mixelo"
-    from_email = FROM_EMAIL_TEXT
+    html_message = render_to_string(
+        "space_invite_email.html",
+        {"space_name": space_name, "space_slug": space_slug, "signup_link": "https://mixelo.io"},
+    )
+
+    sent = 0
+    failed = []
+    with get_connection() as connection:
+        for email in emails:
+            message = EmailMultiAlternatives(subject, "", FROM_EMAIL_TEXT, [email], connection=connection)
+            message.attach_alternative(html_message, "text/html")
+            try:
+                sent += message.send()
+            except smtplib.SMTPException:
+                failed.append(email)
 
-    for email in emails:
-        html_message = render_to_string(
-            "space_invite_email.html",
-            {"space_name": space_name, "space_slug": space_slug, "signup_link": "https://mixelo.io"},
-        )
-        send_mail(subject, "", from_email, [email], html_message=html_message)
+    logger.info(
+        "Space %s invitations batch %s/%s: %s sent, %s failed.",
+        space_slug,
+        batch_number,
+        batch_count,
+        sent,
+        len(failed),
+    )
+    return {"batch": batch_number, "batches": batch_count, "sent": sent, "failed": failed}
@@ -1,6 +1,6 @@
 import re
 
-from django.db.models import Q
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, Q, Value, When
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
@@ -9,24 +9,31 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.serializers import ValidationError
 
-from .models import Space, MembershipRequest
+from .models import Space, SpaceMembership, MembershipRequest
 from .permissions import SpacePermissions, MembershipRequestPermissions, MembershipInvitationPermissions
+from .services import administered_spaces
 from .serializers import (
     SpaceSerializer,
     SpaceActiveSerializer,
     SpaceDetailSerializer,
     MembershipRequestSerializer,
     MembershipRequestInvitationSerializer,
+    MembershipRequestInboxSerializer,
     MembershipRequestUpdateSerializer,
 )
-from .tasks import send_space_invitation_email
+from .tasks import send_space_invitation_email, INVITATION_EMAIL_BATCH_SIZE
 
 from apps.base.models import TopicTag
 from apps.users.models import CustomUser
-from apps.base.serializers import TopicTagSerializer
+from apps.base.services import topic_tree_for
 from apps.users.serializers import UserDetailSerializer
 
 
+TYPEAHEAD_MIN_SEARCH_LENGTH = 3  # shorter terms cannot use the trigram indexes
+TYPEAHEAD_DEFAULT_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 25
+
+
 class SpacesPagination(PageNumberPagination):
     page_size = 15
     page_size_query_param = "page_size"
@@ -55,8 +62,8 @@ class SpaceViewSet(viewsets.ModelViewSet):
             public_spaces = Q(access_type="free")
 
             if user.is_authenticated:
-                private_user_spaces = Q(owner=user) | Q(admins=user) | Q(members=user)
-                return base_queryset.filter(public_spaces | private_user_spaces).distinct()
+                membership = SpaceMembership.objects.filter(space=OuterRef("pk"), user=user)
+                return base_queryset.filter(public_spaces | Q(owner=user) | Q(Exists(membership)))
 
             return base_queryset.filter(public_spaces)
 
@@ -92,9 +99,7 @@ class SpaceViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
     def categories(self, request, pk=None):
         space = self.get_object()
-        categories = space.categories.all()
-        serializer = TopicTagSerializer(categories, many=True)
-        return Response(serializer.data)
+        return Response(topic_tree_for(request, space.id))
 
     @action(detail=False, methods=["get"], url_path="find-by-slug/(?P<slug>[^/.]+)", url_name="find-by-slug")
     def find_by_slug(self, request, slug=None):
@@ -118,7 +123,8 @@ class SpaceViewSet(viewsets.ModelViewSet):
         """
         user = request.user
         search = request.query_params.get("search")
-        spaces = Space.objects.filter(Q(owner=user) | Q(members__in=[user]) | Q(admins__in=[user])).distinct()
+        membership = SpaceMembership.objects.filter(space=OuterRef("pk"), user=user)
+        spaces = Space.objects.filter(Q(owner=user) | Q(Exists(membership)))
         if search:
             spaces = spaces.filter(name__icontains=search)
         serializer = SpaceDetailSerializer(spaces, many=True, context={"request": request})
@@ -184,9 +190,11 @@ class SpaceViewSet(viewsets.ModelViewSet):
         except Space.DoesNotExist:
             return Response({"detail": "Space not found."}, status=404)
         search_term = request.query_params.get("search", "").strip()
-        pending_requests = MembershipRequest.objects.filter(
-            space=space, request_type="request", status="pending"
-        ).select_related("user")
+        pending_requests = (
+            MembershipRequest.objects.filter(space=space, request_type="request", status="pending")
+            .select_related("user__profile_color", "user__experience")
+            .order_by("-created_time", "-id")
+        )
         if search_term:
             pending_requests = pending_requests.filter(
                 Q(user__first_name__icontains=search_term)
@@ -194,17 +202,13 @@ class SpaceViewSet(viewsets.ModelViewSet):
                 | Q(user__email__icontains=search_term)
             )
 
-        users = [req.user for req in pending_requests]
-        request_map = {req.user.id: req.id for req in pending_requests}
-
-        page = self.paginate_queryset(users)
+        page = self.paginate_queryset(pending_requests)
+        requests = page if page is not None else list(pending_requests)
         serializer_context = self.get_serializer_context()
-        serializer_context["request_map"] = request_map
+        serializer_context["request_map"] = {req.user_id: req.id for req in requests}
+        serializer = UserDetailSerializer([req.user for req in requests], many=True, context=serializer_context)
         if page is not None:
-            serializer = UserDetailSerializer(page, many=True, context=serializer_context)
             return self.get_paginated_response(serializer.data)
-
-        serializer = UserDetailSerializer(users, many=True, context=serializer_context)
         return Response(serializer.data)
 
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated], url_path="make-admin")
@@ -244,10 +248,11 @@ class SpaceViewSet(viewsets.ModelViewSet):
                 {"detail": "You cannot leave your own space. Transfer ownership or delete the space."}, status=400
             )
 
-        if space.admins.filter(id=user.id).exists():
+        role = space.get_user_role(user)
+        if role == SpaceMembership.Role.ADMIN:
             space.admins.remove(user)
             return Response({"detail": "You have left the space."}, status=200)
-        if space.members.filter(id=user.id).exists():
+        if role == SpaceMembership.Role.MEMBER:
             space.members.remove(user)
             return Response({"detail": "You have left the space."}, status=200)
         return Response({"detail": "You are not a member of this space."}, status=400)
@@ -271,8 +276,8 @@ class SpaceViewSet(viewsets.ModelViewSet):
             space.members.remove(target_user)
             return Response({"detail": f"User {user_id} removed."}, status=200)
 
-        if space.admins.filter(id=current_user.id).exists():
-            if target_user == space.owner or space.admins.filter(id=user_id).exists():
+        if space.get_user_role(current_user) == SpaceMembership.Role.ADMIN:
+            if target_user == space.owner or space.get_user_role(target_user) == SpaceMembership.Role.ADMIN:
                 return Response({"detail": "Admins cannot remove other admins or the owner."}, status=403)
             space.members.remove(target_user)
             return Response({"detail": f"Member {user_id} removed."}, status=200)
@@ -281,20 +286,41 @@ class SpaceViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["get"], url_path="users-to-invite", permission_classes=[IsAuthenticated])
     def users_to_invite(self, request, pk=None):
+        """
+        Users that can still be invited to the space. Pass `typeahead=true` to get only the
+        best `limit` matches for `search`, unpaginated, for autocomplete inputs.
+        """
         space = self.get_object()
 
-        excluded_ids = [space.owner_id]
-        excluded_ids += list(space.admins.values_list("id", flat=True))
-        excluded_ids += list(space.members.values_list("id", flat=True))
-        pending_ids = MembershipRequest.objects.filter(space=space, status="pending").values_list("user_id", flat=True)
-        excluded_ids += list(pending_ids)
-
-        queryset = CustomUser.objects.exclude(id__in=excluded_ids)
+        already_in_space = SpaceMembership.objects.filter(space=space, user=OuterRef("pk"))
+        already_pending = MembershipRequest.objects.filter(space=space, user=OuterRef("pk"), status="pending")
+        queryset = (
+            CustomUser.objects.select_related("profile_color", "experience")
+            .exclude(id=space.owner_id)
+            .exclude(Exists(already_in_space))
+            .exclude(Exists(already_pending))
+        )
         search = request.query_params.get("search", "").strip()
         if search:
-            queryset = queryset.filter(Q(first_name__icontains=search) | Q(last_name__icontains=search))
+            queryset = queryset.filter(
+                Q(first_name__icontains=search) | Q(last_name__icontains=search) | Q(email__icontains=search)
+            )
 
-        page = self.paginate_queryset(queryset)
+        if request.query_params.get("typeahead", "").lower() in ("true", "1", "yes"):
+            if len(search) < TYPEAHEAD_MIN_SEARCH_LENGTH:
+                return Response([])
+            try:
+                limit = min(int(request.query_params.get("limit", TYPEAHEAD_DEFAULT_LIMIT)), TYPEAHEAD_MAX_LIMIT)
+            except ValueError:
+                limit = TYPEAHEAD_DEFAULT_LIMIT
+            prefix_match = Q(first_name__istartswith=search) | Q(last_name__istartswith=search)
+            matches = queryset.annotate(
+                rank=Case(When(prefix_match, then=Value(0)), default=Value(1), output_field=IntegerField())
+            ).order_by("rank", "first_name", "last_name", "id")[: max(limit, 1)]
+            serializer = UserDetailSerializer(matches, many=True, context={"request": request})
+            return Response(serializer.data)
+
+        page = self.paginate_queryset(queryset.order_by("id"))
         serializer = UserDetailSerializer(page, many=True, context={"request": request})
         return self.get_paginated_response(serializer.data)
 
@@ -302,20 +328,28 @@ class SpaceViewSet(viewsets.ModelViewSet):
     def invite_multiple(self, request, pk=None):
         space = self.get_object()
         user_ids = request.data.get("user_ids", [])
+        if not isinstance(user_ids, list):
+            return Response({"detail": "user_ids must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        already_in_space = SpaceMembership.objects.filter(space=space, user=OuterRef("pk"))
+        already_pending = MembershipRequest.objects.filter(space=space, user=OuterRef("pk"), status="pending")
+        eligible_ids = (
+            CustomUser.objects.filter(id__in=user_ids)
+            .exclude(id=space.owner_id)
+            .exclude(Exists(already_in_space))
+            .exclude(Exists(already_pending))
+            .values_list("id", flat=True)
+        )
+        invitations = MembershipRequest.objects.bulk_create(
+            [
+                MembershipRequest(space=space, user_id=uid, request_type="invite", status="pending")
+                for uid in eligible_ids
+            ]
+        )
 
-        for uid in user_ids:
-            if space.members.filter(id=uid).exists():
-                continue
-            if space.admins.filter(id=uid).exists():
-                continue
-
-            if MembershipRequest.objects.filter(
-                space=space, user_id=uid, request_type="invite", status="pending"
-            ).exists():
-                continue
-            MembershipRequest.objects.create(space=space, user_id=uid, request_type="invite", status="pending")
-
-        return Response({"detail": "Invitations sent successfully."}, status=status.HTTP_200_OK)
+        return Response(
+            {"detail": "Invitations sent successfully.", "invited_count": len(invitations)}, status=status.HTTP_200_OK
+        )
 
     @action(detail=True, methods=["post"], url_path="invite-emails", permission_classes=[IsAuthenticated])
     def invite_emails(self, request, pk=None):
@@ -332,10 +366,19 @@ class SpaceViewSet(viewsets.ModelViewSet):
         if not valid_emails:
             return Response({"detail": "No valid emails provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        send_space_invitation_email.delay(valid_emails, space.name, space.slug)
+        valid_emails = list(dict.fromkeys(valid_emails))
+        batches = [
+            valid_emails[i : i + INVITATION_EMAIL_BATCH_SIZE]
+            for i in range(0, len(valid_emails), INVITATION_EMAIL_BATCH_SIZE)
+        ]
+        for batch_number, batch in enumerate(batches, start=1):
+            send_space_invitation_email.delay(batch, space.name, space.slug, batch_number, len(batches))
 
         return Response(
-            {"detail": f"Invitation emails are being sent to {len(valid_emails)} recipients."},
+            {
+                "detail": f"Invitation emails are being sent to {len(valid_emails)} recipients.",
+                "batches": len(batches),
+            },
             status=status.HTTP_200_OK,
         )
 
@@ -353,8 +396,8 @@ class MembershipRequestViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return (
             MembershipRequest.objects.filter(request_type="request")
-            .filter(Q(user=user) | Q(space__admins__in=[user]) | Q(space__owner=user))
-            .distinct()
+            .filter(Q(user=user) | Q(space__in=administered_spaces(user)))
+            .order_by("-created_time", "-id")
         )
 
     def get_serializer_class(self):
@@ -365,6 +408,44 @@ class MembershipRequestViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user, status="pending", request_type="request")
 
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated], url_path="inbox")
+    def inbox(self, request):
+        """
+        Pending join requests across every space the user owns or administers, newest first.
+        `spaces` lists the pending count of each of those spaces; `?space=<id>` narrows the page.
+        """
+        pending = MembershipRequest.objects.filter(
+            space__in=administered_spaces(request.user), request_type="request", status="pending"
+        )
+        pending_counts = (
+            pending.values("space", "space__name", "space__slug")
+            .annotate(pending_count=Count("id"))
+            .order_by("-pending_count", "space")
+        )
+
+        queryset = pending.select_related("space", "user__profile_color", "user__experience").order_by(
+            "-created_time", "-id"
+        )
+        space_id = request.query_params.get("space")
+        if space_id:
+            if not space_id.isdigit():
+                return Response({"detail": "space must be an integer id."}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(space_id=space_id)
+
+        page = self.paginate_queryset(queryset)
+        serializer = MembershipRequestInboxSerializer(page, many=True, context=self.get_serializer_context())
+        response = self.get_paginated_response(serializer.data)
+        response.data["spaces"] = [
+            {
+                "id": row["space"],
+                "name": row["space__name"],
+                "slug": row["space__slug"],
+                "pending_count": row["pending_count"],
+            }
+            for row in pending_counts
+        ]
+        return response
+
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated], url_path="accept")
     def accept_request(self, request, pk=None):
         try:
@@ -404,8 +485,8 @@ class MembershipInvitationViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return (
             MembershipRequest.objects.filter(request_type="invite")
-            .filter(Q(user=user) | Q(space__admins__in=[user]) | Q(space__owner=user))
-            .distinct()
+            .filter(Q(user=user) | Q(space__in=administered_spaces(user)))
+            .order_by("-created_time", "-id")
         )
 
     def get_serializer_class(self):
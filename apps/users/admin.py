@@ -6,7 +6,7 @@ from .models import ActivityPoints, CustomUser, Gender, Experience, ProfileColor
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
-    readonly_fields = ("coin_balance", "average_score", "points", "level")
+    readonly_fields = ("coin_balance", "average_score", "score_sum", "scored_attempts_count", "points", "level")
 
 
 admin.site.register(Gender)
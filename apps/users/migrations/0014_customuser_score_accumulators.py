@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_customuser_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='score_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='scored_attempts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -7,6 +7,8 @@ from django.core.cache import cache
 from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import AbstractUser, UserManager
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 from rest_framework.authtoken.models import Token
 from django_countries.fields import CountryField
 
@@ -98,6 +100,8 @@ class CustomUser(AbstractUser):
     coin_balance = models.IntegerField(default=0)
     coin_last_updated_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     average_score = models.FloatField(default=0)
+    score_sum = models.FloatField(default=0)  # running sum/count of finished attempt scores
+    scored_attempts_count = models.PositiveIntegerField(default=0)
     points = models.IntegerField(default=0)
     level = models.PositiveSmallIntegerField(default=0)
 
@@ -106,6 +110,14 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = []
     objects = MrvUserManager()
 
+    class Meta(AbstractUser.Meta):
+        # Trigram indexes over the expressions Django emits for `icontains`, for people search.
+        indexes = [
+            GinIndex(OpClass(Upper("first_name"), name="gin_trgm_ops"), name="users_first_name_trgm"),
+            GinIndex(OpClass(Upper("last_name"), name="gin_trgm_ops"), name="users_last_name_trgm"),
+            GinIndex(OpClass(Upper("email"), name="gin_trgm_ops"), name="users_email_trgm"),
+        ]
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
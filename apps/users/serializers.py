@@ -131,6 +131,7 @@ class CompleteUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         exclude = ["password"]
+        read_only_fields = ("score_sum", "scored_attempts_count")
 
     def get_user_level_display(self, obj):
         numeric_level, level_name = get_user_level(obj)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from apps.base.admin import ReadOnlyModelAdmin
-from .models import CoinLedgerEntry, CoinPackage, CoinPurchase, CoinSpend
+from .models import CoinBalanceSnapshot, CoinLedgerEntry, CoinPackage, CoinPurchase, CoinSpend, StripeEvent
 
 
 @admin.register(CoinLedgerEntry)
@@ -46,3 +46,43 @@ class CoinSpendAdmin(ReadOnlyModelAdmin):
     list_per_page = 100
     list_select_related = ("user",)
     readonly_fields = ("id", "user", "reason", "coins", "target_type", "target_id", "created_at")
+
+
+@admin.register(CoinBalanceSnapshot)
+class CoinBalanceSnapshotAdmin(ReadOnlyModelAdmin):
+    list_display = ("id", "user", "balance", "as_of", "created_at")
+    ordering = ("-as_of",)
+    search_fields = ("user__email",)
+    list_per_page = 100
+    list_select_related = ("user",)
+    readonly_fields = ("id", "user", "balance", "as_of", "created_at")
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(ReadOnlyModelAdmin):
+    list_display = (
+        "id",
+        "event_id",
+        "event_type",
+        "status",
+        "attempts",
+        "received_at",
+        "next_attempt_at",
+        "processed_at",
+    )
+    ordering = ("-received_at",)
+    list_filter = ("status", "event_type")
+    search_fields = ("event_id",)
+    list_per_page = 100
+    readonly_fields = (
+        "id",
+        "event_id",
+        "event_type",
+        "payload",
+        "status",
+        "attempts",
+        "error",
+        "received_at",
+        "next_attempt_at",
+        "processed_at",
+    )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from apps.wallet.models import StripeEvent
+from apps.wallet.services import replay_stripe_events
+from apps.wallet.tasks import process_stripe_events
+
+
+class Command(BaseCommand):
+    help = "Queue stored Stripe events to be applied again (failed events by default) and process them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_ids", nargs="*", help="Only replay these Stripe event ids.")
+        parser.add_argument(
+            "--status",
+            choices=StripeEvent.Status.values,
+            default=StripeEvent.Status.FAILED,
+            help="Replay events in this status (ignored when event ids are given).",
+        )
+        parser.add_argument("--since", help="Only replay events received at or after this ISO datetime.")
+        parser.add_argument("--async", action="store_true", dest="run_async", help="Leave processing to Celery.")
+
+    def handle(self, *args, **options):
+        events = StripeEvent.objects.all()
+        if options["event_ids"]:
+            events = events.filter(event_id__in=options["event_ids"])
+        else:
+            events = events.filter(status=options["status"])
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+            events = events.filter(received_at__gte=since)
+
+        queued = replay_stripe_events(events)
+        self.stdout.write(f"{queued} events queued")
+        if options["run_async"]:
+            process_stripe_events.delay()
+        else:
+            self.stdout.write(f"Processed: {process_stripe_events()}")
+        self.stdout.write(self.style.SUCCESS("Stripe events replayed."))
@@ -0,0 +1,65 @@
+import json
+import time
+import uuid
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from apps.wallet.models import CoinPurchase
+from apps.wallet.services import sign_stripe_payload
+from apps.wallet.views import stripe_webhook
+
+
+class Command(BaseCommand):
+    help = (
+        "Send a checkout.session.completed event for a purchase to the Stripe webhook, signed with "
+        "STRIPE_WEBHOOK_SECRET the way Stripe signs it, to exercise the webhook without Stripe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("purchase_id", help="CoinPurchase id the event completes.")
+        parser.add_argument("--event-id", help="Stripe event id; reuse one to simulate a retry.")
+        parser.add_argument("--url", help="POST to this webhook URL instead of calling the view in-process.")
+
+    def handle(self, *args, **options):
+        try:
+            purchase = CoinPurchase.objects.get(id=options["purchase_id"])
+        except (CoinPurchase.DoesNotExist, ValueError):
+            raise CommandError(f"Purchase not found: {options['purchase_id']}")
+
+        event_id = options["event_id"] or f"evt_stub_{uuid.uuid4().hex}"
+        payload = json.dumps(
+            {
+                "id": event_id,
+                "object": "event",
+                "type": "checkout.session.completed",
+                "created": int(time.time()),
+                "data": {
+                    "object": {
+                        "id": purchase.stripe_checkout_session_id or f"cs_stub_{uuid.uuid4().hex}",
+                        "object": "checkout.session",
+                        "metadata": {"purchase_id": str(purchase.id)},
+                        "payment_intent": f"pi_stub_{uuid.uuid4().hex}",
+                    }
+                },
+            }
+        )
+        signature = sign_stripe_payload(payload, settings.STRIPE_WEBHOOK_SECRET)
+
+        if options["url"]:
+            request = Request(
+                options["url"],
+                data=payload.encode(),
+                headers={"Content-Type": "application/json", "Stripe-Signature": signature},
+            )
+            with urlopen(request) as response:
+                status_code = response.status
+        else:
+            request = RequestFactory().post(
+                "/wallet/webhook/", payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=signature
+            )
+            status_code = stripe_webhook(request).status_code
+
+        self.stdout.write(f"{event_id}: webhook answered {status_code}")
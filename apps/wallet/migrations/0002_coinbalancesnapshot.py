@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoinBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.BigIntegerField()),
+                ('as_of', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coin_balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-as_of'], name='wallet_coin_user_id_83e6e5_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coinbalancesnapshot',
+            constraint=models.UniqueConstraint(fields=('user', 'as_of'), name='wallet_snapshot_user_as_of_uniq'),
+        ),
+    ]
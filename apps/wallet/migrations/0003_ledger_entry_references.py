@@ -0,0 +1,47 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_coinbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='coinledgerentry',
+            name='wallet_coin_user_id_7bdc8a_idx',
+        ),
+        migrations.AddField(
+            model_name='coinledgerentry',
+            name='detail',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='coinledgerentry',
+            name='purchase',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='wallet.coinpurchase'),
+        ),
+        migrations.AddField(
+            model_name='coinledgerentry',
+            name='spend',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='wallet.coinspend'),
+        ),
+        migrations.AddField(
+            model_name='coinledgerentry',
+            name='target_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='coinledgerentry',
+            name='target_type',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='coinledgerentry',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='wallet_coin_user_id_a78a2a_idx'),
+        ),
+    ]
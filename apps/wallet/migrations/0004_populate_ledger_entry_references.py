@@ -0,0 +1,133 @@
+# Generated by Django 4.2.6 on 2026-10-19 03:20
+
+from django.db import migrations
+from django.db.models import Q
+
+BATCH_SIZE = 1000
+
+SPEND_TARGETS = {
+    "avatar_item": ("avatar", "AvatarItemCatalog"),
+    "item_color": ("avatar", "AvatarColorCatalog"),
+    "skin_color": ("avatar", "AvatarSkinColorCatalog"),
+}
+
+
+def _item_detail(item):
+    return {
+        "item": {
+            "id": item.id,
+            "name": item.name,
+            "code": item.code,
+            "item_type": item.item_type,
+            "avatar_type": item.avatar_type,
+            "svg": item.svg,
+        }
+    }
+
+
+def _item_color_detail(color):
+    return {"color": {"id": color.id, "name": color.name, "code": color.code, "hex": color.hex}}
+
+
+def _skin_color_detail(skin):
+    return {
+        "color": {
+            "id": skin.id,
+            "name": skin.name,
+            "code": skin.code,
+            "main_color": skin.main_color,
+            "second_color": skin.second_color,
+        }
+    }
+
+
+TARGET_DETAILS = {
+    "avatar_item": _item_detail,
+    "item_color": _item_color_detail,
+    "skin_color": _skin_color_detail,
+}
+
+
+def _purchase_detail(purchase, package_name):
+    return {
+        "type": "purchase",
+        "package_name": package_name,
+        "coins": purchase.coins,
+        "price_cents": purchase.price_cents,
+        "price_display": f"{purchase.price_cents / 100:.2f} {purchase.currency}",
+        "currency": purchase.currency,
+    }
+
+
+def _spend_detail(spend, target=None):
+    detail = {"type": "spend", "reason": spend.reason, "coins": spend.coins}
+    if target is not None:
+        detail.update(TARGET_DETAILS[spend.target_type](target))
+    return detail
+
+
+def populate_ledger_entry_references(apps, schema_editor):
+    # A frozen copy of apps.wallet.services.backfill_ledger_references as of this migration.
+    CoinLedgerEntry = apps.get_model("wallet", "CoinLedgerEntry")
+    CoinPurchase = apps.get_model("wallet", "CoinPurchase")
+    CoinSpend = apps.get_model("wallet", "CoinSpend")
+
+    pending = CoinLedgerEntry.objects.filter(purchase__isnull=True, spend__isnull=True, detail={}).filter(
+        Q(reference_id__startswith="purchase:") | Q(reference_id__startswith="spend:")
+    )
+    last_id = 0
+    while True:
+        entries = list(pending.filter(id__gt=last_id).order_by("id")[:BATCH_SIZE])
+        if not entries:
+            return
+        last_id = entries[-1].id
+
+        references = {}
+        for entry in entries:
+            kind, _sep, reference = entry.reference_id.partition(":")
+            references.setdefault(kind, set()).add(reference)
+        purchases = {
+            str(purchase.id): purchase
+            for purchase in CoinPurchase.objects.filter(id__in=references.get("purchase", ())).select_related("package")
+        }
+        spend_ids = [int(reference) for reference in references.get("spend", ()) if reference.isdigit()]
+        spends = {str(spend.id): spend for spend in CoinSpend.objects.filter(id__in=spend_ids)}
+        targets = {}
+        for target_type, model in SPEND_TARGETS.items():
+            target_ids = [
+                int(spend.target_id)
+                for spend in spends.values()
+                if spend.target_type == target_type and spend.target_id.isdigit()
+            ]
+            Catalog = apps.get_model(*model)
+            targets.update(((target_type, str(t.id)), t) for t in Catalog.objects.filter(id__in=target_ids))
+
+        changed = []
+        for entry in entries:
+            kind, _sep, reference = entry.reference_id.partition(":")
+            if kind == "purchase" and reference in purchases:
+                purchase = purchases[reference]
+                entry.purchase = purchase
+                entry.detail = _purchase_detail(purchase, purchase.package.name)
+            elif kind == "spend" and reference in spends:
+                spend = spends[reference]
+                entry.spend = spend
+                entry.target_type, entry.target_id = spend.target_type, spend.target_id
+                target = targets.get((spend.target_type, spend.target_id))
+                entry.detail = _spend_detail(spend, target if spend.target_type in TARGET_DETAILS else None)
+            else:
+                continue
+            changed.append(entry)
+        CoinLedgerEntry.objects.bulk_update(changed, ["purchase", "spend", "target_type", "target_id", "detail"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("avatar", "0006_avatar_ki_color_avatar_ki_item_and_more"),
+        ("wallet", "0003_ledger_entry_references"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_ledger_entry_references, reverse_code=migrations.RunPython.noop),
+    ]
@@ -2,8 +2,12 @@ import uuid
 
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 from apps.users.models import CustomUser
+from apps.wallet.services import invalidate_coin_packages
 
 
 class CoinPackage(models.Model):
@@ -30,9 +34,20 @@ class CoinLedgerEntry(models.Model):
 
     idempotency_key = models.CharField(max_length=120, unique=True)
 
+    purchase = models.ForeignKey(
+        "CoinPurchase", on_delete=models.PROTECT, blank=True, null=True, related_name="ledger_entries"
+    )
+    spend = models.ForeignKey(
+        "CoinSpend", on_delete=models.PROTECT, blank=True, null=True, related_name="ledger_entries"
+    )
+    target_type = models.CharField(max_length=50, blank=True, default="")
+    target_id = models.CharField(max_length=100, blank=True, default="")
+    # Display fields of the purchase or spend, copied at insert time so history pages need no joins.
+    detail = models.JSONField(default=dict, blank=True)
+
     class Meta:
         indexes = [
-            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["user", "-created_at", "-id"]),
         ]
 
 
@@ -80,3 +95,56 @@ class CoinSpend(models.Model):
 
     target_type = models.CharField(max_length=50, blank=True, default="")
     target_id = models.CharField(max_length=100, blank=True, default="")
+
+
+class CoinBalanceSnapshot(models.Model):
+    """Ledger balance of a user (credits minus debits) over every entry created up to `as_of`."""
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="coin_balance_snapshots")
+    balance = models.BigIntegerField()
+    as_of = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "as_of"], name="wallet_snapshot_user_as_of_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-as_of"]),
+        ]
+
+
+class StripeEvent(models.Model):
+    """A verified Stripe webhook event, stored as received and applied later by process_stripe_events."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSED = "processed"
+        IGNORED = "ignored"
+        FAILED = "failed"
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["received_at", "id"],
+                name="wallet_stripeevent_pending_idx",
+                condition=models.Q(status="pending"),
+            ),
+            models.Index(fields=["status", "-received_at"]),
+        ]
+
+
+@receiver(post_save, sender=CoinPackage)
+@receiver(post_delete, sender=CoinPackage)
+def invalidate_coin_packages_on_change(sender, instance, **kwargs):
+    invalidate_coin_packages()
@@ -0,0 +1,32 @@
+import uuid
+from types import SimpleNamespace
+
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+PaymentError = stripe.error.StripeError
+
+
+class StripeCheckoutClient:
+    """Creates hosted Stripe Checkout sessions."""
+
+    def create_checkout_session(self, **params):
+        return stripe.checkout.Session.create(api_key=settings.STRIPE_SECRET_KEY, **params)
+
+
+class FakeCheckoutClient:
+    """
+    Answers like Stripe without the network, for local runs and benchmarks of the checkout
+    path. Complete its sessions with the send_stripe_stub_event command.
+    """
+
+    def create_checkout_session(self, **params):
+        session_id = f"cs_fake_{uuid.uuid4().hex}"
+        return SimpleNamespace(id=session_id, url=f"https://checkout.stripe.invalid/pay/{session_id}")
+
+
+def get_checkout_client():
+    """Instance of the WALLET_CHECKOUT_CLIENT class."""
+    return import_string(settings.WALLET_CHECKOUT_CLIENT)()
@@ -0,0 +1,623 @@
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps as global_apps
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BigIntegerField, Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+CART_MAX_ITEMS = 50
+
+Product = namedtuple("Product", ["catalog", "unlock", "reason", "notification_type", "metadata"])
+
+# Catalog behind each CoinSpend target_type, as (app_label, model_name).
+SPEND_TARGETS = {
+    "avatar_item": ("avatar", "AvatarItemCatalog"),
+    "item_color": ("avatar", "AvatarColorCatalog"),
+    "skin_color": ("avatar", "AvatarSkinColorCatalog"),
+}
+LEDGER_BACKFILL_BATCH_SIZE = 1000
+
+COIN_PACKAGES_CACHE_KEY = "wallet:coin_packages"
+COIN_PACKAGES_CACHE_TIMEOUT = 60 * 60
+
+# A Stripe event that fails to apply is retried with exponential backoff from this delay,
+# and marked failed once it has been attempted this many times.
+STRIPE_EVENT_RETRY_DELAY = timedelta(minutes=1)
+STRIPE_EVENT_MAX_ATTEMPTS = 8
+
+
+class SpendError(Exception):
+    pass
+
+
+class CatalogItemNotFound(SpendError):
+    pass
+
+
+class AlreadyOwned(SpendError):
+    pass
+
+
+class InsufficientCoins(SpendError):
+    pass
+
+
+def get_coin_packages():
+    """
+    Serialized active coin packages, cheapest first, cached until a package changes. For
+    listing only: checkout reads the package it charges for from the database.
+    """
+
+    def load():
+        from apps.wallet.models import CoinPackage
+        from apps.wallet.serializers import CoinPackageSerializer
+
+        packages = CoinPackage.objects.filter(is_active=True).order_by("price_cents")
+        return list(CoinPackageSerializer(packages, many=True).data)
+
+    return cache.get_or_set(COIN_PACKAGES_CACHE_KEY, load, COIN_PACKAGES_CACHE_TIMEOUT)
+
+
+def invalidate_coin_packages():
+    cache.delete(COIN_PACKAGES_CACHE_KEY)
+
+
+def _item_metadata(item):
+    return {
+        "item_id": item.id,
+        "item_name": item.name,
+        "item_type": item.item_type,
+        "avatar_type": item.avatar_type,
+        "code": item.code,
+        "svg": item.svg,
+        "coins": item.price,
+    }
+
+
+def _item_color_metadata(color):
+    return {
+        "color_id": color.id,
+        "color_name": color.name,
+        "hex": color.hex,
+        "coins": color.price,
+        "color_type": "item_color",
+    }
+
+
+def _skin_color_metadata(color):
+    return {
+        "color_id": color.id,
+        "color_name": color.name,
+        "main_color": color.main_color,
+        "coins": color.price,
+        "color_type": "skin_color",
+    }
+
+
+def _item_detail(item):
+    return {
+        "item": {
+            "id": item.id,
+            "name": item.name,
+            "code": item.code,
+            "item_type": item.item_type,
+            "avatar_type": item.avatar_type,
+            "svg": item.svg,
+        }
+    }
+
+
+def _item_color_detail(color):
+    return {"color": {"id": color.id, "name": color.name, "code": color.code, "hex": color.hex}}
+
+
+def _skin_color_detail(skin):
+    return {
+        "color": {
+            "id": skin.id,
+            "name": skin.name,
+            "code": skin.code,
+            "main_color": skin.main_color,
+            "second_color": skin.second_color,
+        }
+    }
+
+
+TARGET_DETAILS = {
+    "avatar_item": _item_detail,
+    "item_color": _item_color_detail,
+    "skin_color": _skin_color_detail,
+}
+
+
+def purchase_ledger_detail(purchase, package_name):
+    return {
+        "type": "purchase",
+        "package_name": package_name,
+        "coins": purchase.coins,
+        "price_cents": purchase.price_cents,
+        "price_display": f"{purchase.price_cents / 100:.2f} {purchase.currency}",
+        "currency": purchase.currency,
+    }
+
+
+def spend_ledger_detail(spend, target=None):
+    detail = {"type": "spend", "reason": spend.reason, "coins": spend.coins}
+    if target is not None:
+        detail.update(TARGET_DETAILS[spend.target_type](target))
+    return detail
+
+
+def spendable_products():
+    """
+    What coins can buy, keyed by the CoinSpend target_type: the catalog, the unlock model,
+    the spend reason, the notification type and its metadata.
+    """
+    from apps.avatar.models import (
+        AvatarColorCatalog,
+        AvatarItemCatalog,
+        AvatarSkinColorCatalog,
+        UserUnlockedColor,
+        UserUnlockedItem,
+        UserUnlockedSkinColor,
+    )
+    from apps.blog.models import Notification
+    from apps.wallet.models import CoinSpend
+
+    return {
+        "avatar_item": Product(
+            AvatarItemCatalog,
+            UserUnlockedItem,
+            CoinSpend.Reason.BUY_ITEM,
+            Notification.Type.ITEM_PURCHASE,
+            _item_metadata,
+        ),
+        "item_color": Product(
+            AvatarColorCatalog,
+            UserUnlockedColor,
+            CoinSpend.Reason.BUY_COLOR,
+            Notification.Type.COLOR_PURCHASE,
+            _item_color_metadata,
+        ),
+        "skin_color": Product(
+            AvatarSkinColorCatalog,
+            UserUnlockedSkinColor,
+            CoinSpend.Reason.BUY_COLOR,
+            Notification.Type.COLOR_PURCHASE,
+            _skin_color_metadata,
+        ),
+    }
+
+
+def debit_coins(user_id, amount):
+    """
+    Take `amount` coins from the user with one conditional UPDATE ... RETURNING, so the
+    balance check and the debit cannot race. Returns the new balance, or None when the
+    balance is too low.
+    """
+    from apps.users.models import CustomUser
+
+    quote = connection.ops.quote_name
+    table = quote(CustomUser._meta.db_table)
+    balance = quote(CustomUser._meta.get_field("coin_balance").column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {balance} = {balance} - %s WHERE id = %s AND {balance} >= %s RETURNING {balance}",
+            [amount, user_id, amount],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def spend_coins(user_id, cart):
+    """
+    Buy every (target_type, catalog_id) of `cart` in one transaction: unlocks, CoinSpends,
+    debit ledger entries and notifications are written with one bulk_create each and the
+    balance with a single conditional UPDATE, so no row lock is held across round trips.
+    Either everything is bought or nothing is; raises CatalogItemNotFound, AlreadyOwned or
+    InsufficientCoins. Returns the unlocks in cart order and the new balance.
+    """
+    from apps.blog.models import Notification
+    from apps.wallet.models import CoinLedgerEntry, CoinSpend
+
+    products = spendable_products()
+    cart = list(dict.fromkeys((target_type, int(catalog_id)) for target_type, catalog_id in cart))
+    if not cart:
+        return [], None
+
+    catalog_items = {}
+    for target_type, product in products.items():
+        ids = [catalog_id for kind, catalog_id in cart if kind == target_type]
+        if ids:
+            catalog_items.update(
+                ((target_type, item.id), item) for item in product.catalog.objects.filter(id__in=ids, is_active=True)
+            )
+    missing = [key for key in cart if key not in catalog_items]
+    if missing:
+        raise CatalogItemNotFound(missing)
+
+    items = [(target_type, catalog_items[target_type, catalog_id]) for target_type, catalog_id in cart]
+    total = sum(item.price for _target_type, item in items)
+
+    with transaction.atomic():
+        # Inserted first: the unique (user, catalog_item) constraints reject owned items before any debit.
+        unlocks = {}
+        try:
+            for target_type, product in products.items():
+                created = product.unlock.objects.bulk_create(
+                    [product.unlock(user_id=user_id, catalog_item=item) for kind, item in items if kind == target_type]
+                )
+                unlocks.update(((target_type, unlock.catalog_item_id), unlock) for unlock in created)
+        except IntegrityError as exc:
+            raise AlreadyOwned() from exc
+
+        balance = debit_coins(user_id, total)
+        if balance is None:
+            raise InsufficientCoins()
+
+        spends = CoinSpend.objects.bulk_create(
+            [
+                CoinSpend(
+                    user_id=user_id,
+                    reason=products[target_type].reason,
+                    coins=item.price,
+                    target_type=target_type,
+                    target_id=str(item.id),
+                )
+                for target_type, item in items
+            ]
+        )
+        CoinLedgerEntry.objects.bulk_create(
+            [
+                CoinLedgerEntry(
+                    user_id=user_id,
+                    entry_type=CoinLedgerEntry.Type.DEBIT,
+                    amount=spend.coins,
+                    reference_id=f"spend:{spend.id}",
+                    idempotency_key=f"spend:{spend.id}",
+                    spend=spend,
+                    target_type=spend.target_type,
+                    target_id=spend.target_id,
+                    detail=spend_ledger_detail(spend, item),
+                )
+                for spend, (_target_type, item) in zip(spends, items)
+            ]
+        )
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    user_id=user_id,
+                    notification_type=products[target_type].notification_type,
+                    metadata=products[target_type].metadata(item),
+                )
+                for target_type, item in items
+            ]
+        )
+
+    return [unlocks[target_type, item.id] for target_type, item in items], balance
+
+
+# Stand-in `as_of` for users without a snapshot: the whole ledger is their tail.
+LEDGER_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def signed_amount():
+    from apps.wallet.models import CoinLedgerEntry
+
+    return Case(
+        When(entry_type=CoinLedgerEntry.Type.DEBIT, then=-F("amount")),
+        default=F("amount"),
+        output_field=BigIntegerField(),
+    )
+
+
+def balance_at(user_id, timestamp=None):
+    """
+    The user's ledger balance over every entry created up to `timestamp` (default: now): the
+    latest snapshot at or before it plus the entries after that snapshot, so the cost follows
+    the tail rather than the whole history.
+    """
+    from apps.wallet.models import CoinBalanceSnapshot, CoinLedgerEntry
+
+    timestamp = timestamp or timezone.now()
+    snapshot = (
+        CoinBalanceSnapshot.objects.filter(user_id=user_id, as_of__lte=timestamp)
+        .order_by("-as_of")
+        .values_list("balance", "as_of")
+        .first()
+    )
+    balance, since = snapshot or (0, LEDGER_EPOCH)
+    tail = CoinLedgerEntry.objects.filter(user_id=user_id, created_at__gt=since, created_at__lte=timestamp).aggregate(
+        total=Coalesce(Sum(signed_amount()), 0)
+    )["total"]
+    return balance + tail
+
+
+def with_ledger_balances(users, as_of):
+    """
+    Annotate `users` with their latest snapshot before `as_of` (`snapshot_balance`,
+    `snapshot_as_of`), the sum and count of ledger entries from there up to `as_of`
+    (`settled_tail`, `settled_entries`) and the sum of the entries after `as_of` (`recent_tail`).
+    One statement, so the ledger and the stored `coin_balance` are read from the same snapshot.
+    """
+    from apps.wallet.models import CoinBalanceSnapshot, CoinLedgerEntry
+
+    latest = CoinBalanceSnapshot.objects.filter(user=OuterRef("pk"), as_of__lte=as_of).order_by("-as_of")
+    entries = CoinLedgerEntry.objects.filter(user=OuterRef("pk")).order_by().values("user")
+
+    def ledger_sum(aggregate, **filters):
+        return Coalesce(Subquery(entries.filter(**filters).annotate(value=aggregate).values("value")), 0)
+
+    return users.annotate(
+        snapshot_balance=Coalesce(Subquery(latest.values("balance")[:1]), 0),
+        snapshot_as_of=Coalesce(Subquery(latest.values("as_of")[:1]), Value(LEDGER_EPOCH)),
+    ).annotate(
+        settled_tail=ledger_sum(Sum(signed_amount()), created_at__gt=OuterRef("snapshot_as_of"), created_at__lte=as_of),
+        settled_entries=ledger_sum(Count("id"), created_at__gt=OuterRef("snapshot_as_of"), created_at__lte=as_of),
+        recent_tail=ledger_sum(Sum(signed_amount()), created_at__gt=as_of),
+    )
+
+
+def reconcile_coin_balances(user_ids, as_of):
+    """
+    Snapshot the ledger balance at `as_of` of every user in `user_ids` that has new entries
+    since their last snapshot, and compare each user's `coin_balance` with the ledger.
+    Returns the number of snapshots written and the drifted users as
+    (user_id, coin_balance, ledger_balance) tuples.
+    """
+    from apps.users.models import CustomUser
+    from apps.wallet.models import CoinBalanceSnapshot
+
+    snapshots = []
+    drifted = []
+    rows = with_ledger_balances(CustomUser.objects.filter(pk__in=user_ids), as_of).values_list(
+        "pk", "coin_balance", "snapshot_balance", "settled_tail", "settled_entries", "recent_tail"
+    )
+    for user_id, coin_balance, snapshot_balance, settled_tail, settled_entries, recent_tail in rows:
+        settled = snapshot_balance + settled_tail
+        if settled_entries:
+            snapshots.append(CoinBalanceSnapshot(user_id=user_id, balance=settled, as_of=as_of))
+        if coin_balance != settled + recent_tail:
+            drifted.append((user_id, coin_balance, settled + recent_tail))
+
+    CoinBalanceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+    return len(snapshots), drifted
+
+
+def backfill_ledger_references():
+    """
+    Fill the purchase/spend references, catalog target and display detail of ledger entries
+    written before they were stored, parsing `reference_id` once. Batched; safe to rerun.
+    Migration wallet 0004 carries its own frozen copy, so changes here don't alter that migration.
+    """
+    CoinLedgerEntry = global_apps.get_model("wallet", "CoinLedgerEntry")
+    CoinPurchase = global_apps.get_model("wallet", "CoinPurchase")
+    CoinSpend = global_apps.get_model("wallet", "CoinSpend")
+
+    pending = CoinLedgerEntry.objects.filter(purchase__isnull=True, spend__isnull=True, detail={}).filter(
+        Q(reference_id__startswith="purchase:") | Q(reference_id__startswith="spend:")
+    )
+    updated = 0
+    last_id = 0
+    while True:
+        entries = list(pending.filter(id__gt=last_id).order_by("id")[:LEDGER_BACKFILL_BATCH_SIZE])
+        if not entries:
+            return updated
+        last_id = entries[-1].id
+
+        references = {}
+        for entry in entries:
+            kind, _sep, reference = entry.reference_id.partition(":")
+            references.setdefault(kind, set()).add(reference)
+        purchases = {
+            str(purchase.id): purchase
+            for purchase in CoinPurchase.objects.filter(id__in=references.get("purchase", ())).select_related("package")
+        }
+        spend_ids = [int(reference) for reference in references.get("spend", ()) if reference.isdigit()]
+        spends = {str(spend.id): spend for spend in CoinSpend.objects.filter(id__in=spend_ids)}
+        targets = {}
+        for target_type, model in SPEND_TARGETS.items():
+            target_ids = [
+                int(spend.target_id)
+                for spend in spends.values()
+                if spend.target_type == target_type and spend.target_id.isdigit()
+            ]
+            Catalog = global_apps.get_model(*model)
+            targets.update(((target_type, str(t.id)), t) for t in Catalog.objects.filter(id__in=target_ids))
+
+        changed = []
+        for entry in entries:
+            kind, _sep, reference = entry.reference_id.partition(":")
+            if kind == "purchase" and reference in purchases:
+                purchase = purchases[reference]
+                entry.purchase = purchase
+                entry.detail = purchase_ledger_detail(purchase, purchase.package.name)
+            elif kind == "spend" and reference in spends:
+                spend = spends[reference]
+                entry.spend = spend
+                entry.target_type, entry.target_id = spend.target_type, spend.target_id
+                target = targets.get((spend.target_type, spend.target_id))
+                entry.detail = spend_ledger_detail(spend, target if spend.target_type in TARGET_DETAILS else None)
+            else:
+                continue
+            changed.append(entry)
+        updated += CoinLedgerEntry.objects.bulk_update(
+            changed, ["purchase", "spend", "target_type", "target_id", "detail"]
+        )
+
+
+def record_stripe_event(payload):
+    """
+    Store a verified webhook body for process_stripe_events with a single INSERT. Stripe
+    retries of an event already stored are dropped by the unique event id.
+    """
+    from apps.wallet.models import StripeEvent
+
+    event = json.loads(payload)
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event["id"], event_type=event["type"], payload=event)], ignore_conflicts=True
+    )
+
+
+def _checkout_purchase_id(event):
+    session = (event.payload.get("data") or {}).get("object") or {}
+    try:
+        return uuid.UUID(str((session.get("metadata") or {}).get("purchase_id")))
+    except ValueError:
+        return None
+
+
+def _complete_purchases(events, purchases):
+    """
+    Mark the purchases paid for one user's checkout.session.completed events and credit the
+    coins: the purchases, ledger entries and notifications are written in bulk and the balance
+    with one UPDATE. Purchases already paid are skipped.
+    """
+    from apps.blog.models import Notification
+    from apps.users.models import CustomUser
+    from apps.wallet.models import CoinLedgerEntry, CoinPurchase
+    from apps.wallet.tasks import send_coin_purchase_email
+
+    now = timezone.now()
+    paid = []
+    for event in events:
+        purchase = purchases[_checkout_purchase_id(event)]
+        if purchase.status == CoinPurchase.Status.PAID or purchase in paid:
+            continue
+        purchase.status = CoinPurchase.Status.PAID
+        purchase.paid_at = now
+        purchase.stripe_payment_intent_id = event.payload["data"]["object"].get("payment_intent")
+        paid.append(purchase)
+    if not paid:
+        return
+
+    user_id = paid[0].user_id
+    CoinPurchase.objects.bulk_update(paid, ["status", "paid_at", "stripe_payment_intent_id"])
+    CoinLedgerEntry.objects.bulk_create(
+        [
+            CoinLedgerEntry(
+                user_id=user_id,
+                entry_type=CoinLedgerEntry.Type.CREDIT,
+                amount=purchase.coins,
+                reference_id=f"purchase:{purchase.id}",
+                idempotency_key=f"purchase:{purchase.id}",
+                purchase=purchase,
+                detail=purchase_ledger_detail(purchase, purchase.package.name),
+            )
+            for purchase in paid
+        ]
+    )
+    CustomUser.objects.filter(pk=user_id).update(coin_balance=F("coin_balance") + sum(p.coins for p in paid))
+    Notification.objects.bulk_create(
+        [
+            Notification(
+                user_id=user_id,
+                notification_type=Notification.Type.COIN_PURCHASE_SUCCESS,
+                metadata={"coins": purchase.coins, "price_cents": purchase.price_cents, "currency": purchase.currency},
+            )
+            for purchase in paid
+        ]
+    )
+    for purchase in paid:
+        transaction.on_commit(
+            lambda purchase=purchase: send_coin_purchase_email.delay(
+                user_id, purchase.coins, purchase.price_cents, purchase.currency
+            )
+        )
+
+
+def apply_stripe_events(events):
+    """
+    Apply stored events in order. checkout.session.completed events are grouped by the
+    purchase's user and each user's group is applied in its own savepoint, so a failing group
+    does not hold back the others. Other event types are ignored. A failed event goes back to
+    pending with exponential backoff, and is marked failed after STRIPE_EVENT_MAX_ATTEMPTS
+    attempts or when it names no purchase at all.
+    Returns the number of events per resulting status.
+    """
+    from apps.wallet.models import CoinPurchase, StripeEvent
+
+    Status = StripeEvent.Status
+    now = timezone.now()
+
+    def retry_or_fail(event, error):
+        event.error = error
+        if event.attempts < STRIPE_EVENT_MAX_ATTEMPTS:
+            event.status = Status.PENDING
+            event.next_attempt_at = now + STRIPE_EVENT_RETRY_DELAY * 2 ** (event.attempts - 1)
+        else:
+            event.status = Status.FAILED
+
+    checkouts = [event for event in events if event.event_type == "checkout.session.completed"]
+    for event in events:
+        event.attempts += 1
+        event.status, event.error = Status.IGNORED, ""
+    purchase_users = dict(
+        CoinPurchase.objects.filter(id__in=[_checkout_purchase_id(event) for event in checkouts]).values_list(
+            "id", "user_id"
+        )
+    )
+
+    by_user = {}
+    for event in checkouts:
+        purchase_id = _checkout_purchase_id(event)
+        if purchase_id is None:
+            event.status, event.error = Status.FAILED, "No purchase_id in the session metadata."
+        elif purchase_id not in purchase_users:
+            # The purchase may not be committed yet; its checkout and this event can race.
+            retry_or_fail(event, "Purchase not found.")
+        else:
+            by_user.setdefault(purchase_users[purchase_id], []).append(event)
+
+    for user_events in by_user.values():
+        try:
+            with transaction.atomic():
+                purchases = {
+                    purchase.id: purchase
+                    for purchase in CoinPurchase.objects.select_related("package")
+                    .select_for_update(of=("self",))
+                    .filter(id__in={_checkout_purchase_id(event) for event in user_events})
+                }
+                _complete_purchases(user_events, purchases)
+        except Exception as exc:
+            for event in user_events:
+                retry_or_fail(event, repr(exc))
+        else:
+            for event in user_events:
+                event.status = Status.PROCESSED
+
+    for event in events:
+        event.processed_at = now if event.status in (Status.PROCESSED, Status.IGNORED) else None
+    StripeEvent.objects.bulk_update(events, ["status", "attempts", "error", "next_attempt_at", "processed_at"])
+    counts = {}
+    for event in events:
+        counts[event.status] = counts.get(event.status, 0) + 1
+    return counts
+
+
+def replay_stripe_events(events):
+    """
+    Queue stored events to be applied again now, with a fresh retry budget; paid purchases are
+    never credited twice.
+    """
+    from apps.wallet.models import StripeEvent
+
+    return events.update(
+        status=StripeEvent.Status.PENDING, attempts=0, error="", next_attempt_at=timezone.now(), processed_at=None
+    )
+
+
+def sign_stripe_payload(payload, secret, timestamp=None):
+    """Stripe-Signature header for `payload`, as Stripe computes it, for local stub events."""
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
@@ -1,9 +1,28 @@
+from datetime import timedelta
+
 from celery import shared_task
+from celery.utils.log import get_task_logger
 from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Mod
 from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 FROM_EMAIL = "Mixelo Notifications <contact@mixelo.io>"
 
+COIN_RECONCILE_SHARDS = 8
+COIN_RECONCILE_BATCH_SIZE = 500
+# Ledger entries this recent may belong to transactions that have not committed yet.
+COIN_SNAPSHOT_SETTLE_DELAY = timedelta(minutes=5)
+COIN_DRIFT_REPORT_LIMIT = 50
+
+STRIPE_EVENT_BATCH_SIZE = 100
+STRIPE_EVENT_MAX_BATCHES = 20  # leave the rest to the next run
+
+logger = get_task_logger(__name__)
+
 
 @shared_task
 def send_coin_purchase_email(user_id, coins, price_cents, currency):
@@ -23,3 +42,87 @@ def send_coin_purchase_email(user_id, coins, price_cents, currency):
         },
     )
     send_mail(subject, "", FROM_EMAIL, [user.email], html_message=html_message)
+
+
+@shared_task
+def reconcile_coin_balances():
+    """Fan the balance reconciliation out over COIN_RECONCILE_SHARDS shard tasks sharing one `as_of`."""
+    as_of = (timezone.now() - COIN_SNAPSHOT_SETTLE_DELAY).isoformat()
+    for shard in range(COIN_RECONCILE_SHARDS):
+        reconcile_coin_balance_shard.delay(shard, COIN_RECONCILE_SHARDS, as_of)
+
+
+@shared_task
+def reconcile_coin_balance_shard(shard, shards, as_of):
+    """
+    Snapshot the ledger balances of the users with `id % shards == shard` at `as_of`, summing
+    only the entries since each user's previous snapshot, and report those whose
+    `coin_balance` disagrees with the ledger.
+    """
+    from apps.users.models import CustomUser
+    from apps.wallet.services import reconcile_coin_balances as reconcile
+
+    as_of = parse_datetime(as_of)
+    users = CustomUser.objects.annotate(shard=Mod("id", Value(shards))).filter(shard=shard).order_by("pk")
+    checked = snapshots = 0
+    drifted = []
+    last_id = 0
+    while True:
+        user_ids = list(users.filter(pk__gt=last_id).values_list("pk", flat=True)[:COIN_RECONCILE_BATCH_SIZE])
+        if not user_ids:
+            break
+        written, batch_drifted = reconcile(user_ids, as_of)
+        checked += len(user_ids)
+        snapshots += written
+        drifted += batch_drifted
+        last_id = user_ids[-1]
+
+    report = [
+        {"user_id": user_id, "coin_balance": coin_balance, "ledger_balance": ledger_balance}
+        for user_id, coin_balance, ledger_balance in drifted[:COIN_DRIFT_REPORT_LIMIT]
+    ]
+    if drifted:
+        logger.warning(
+            "Coin balance drift in shard %s/%s: %s of %s users, e.g. %s", shard, shards, len(drifted), checked, report
+        )
+    return {"shard": shard, "users": checked, "snapshots": snapshots, "drifted": len(drifted), "drift": report}
+
+
+@shared_task
+def process_stripe_events():
+    """
+    Apply due pending Stripe events in arrival order, a batch at a time. Each batch is claimed
+    with FOR UPDATE SKIP LOCKED, so concurrent runs (after every webhook, and from beat as a
+    safety net) split the queue instead of waiting on each other. Events waiting out a retry
+    backoff are picked up by the first run after it.
+    """
+    from apps.wallet.models import StripeEvent
+    from apps.wallet.services import apply_stripe_events
+
+    totals = {}
+    failed = []
+    for _ in range(STRIPE_EVENT_MAX_BATCHES):
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=StripeEvent.Status.PENDING, next_attempt_at__lte=timezone.now())
+                .order_by("received_at", "id")[:STRIPE_EVENT_BATCH_SIZE]
+            )
+            if not events:
+                break
+            for event_status, count in apply_stripe_events(events).items():
+                totals[event_status] = totals.get(event_status, 0) + count
+            failed += [event for event in events if event.status == StripeEvent.Status.FAILED]
+        if len(events) < STRIPE_EVENT_BATCH_SIZE:
+            break
+
+    for event in failed:
+        logger.error(
+            "Stripe event %s failed after %s attempts and needs replay_stripe_events: %s",
+            event.event_id,
+            event.attempts,
+            event.error,
+        )
+    if totals.get(StripeEvent.Status.PENDING):
+        logger.warning("Stripe events to be retried: %s", totals[StripeEvent.Status.PENDING])
+    return totals
@@ -8,4 +8,5 @@ urlpatterns = [
     path("checkout/<int:package_id>/", views.CreateCheckoutSessionView.as_view(), name="checkout"),
     path("webhook/", views.stripe_webhook, name="webhook"),
     path("history/", views.CoinLedgerHistoryView.as_view(), name="history"),
+    path("cart/checkout/", views.CartCheckoutView.as_view(), name="cart-checkout"),
 ]
@@ -1,43 +1,49 @@
+import uuid
+
 import stripe
 from django.conf import settings
 from django.db import transaction
-from django.db.models import F
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.avatar.models import AvatarColorCatalog, AvatarItemCatalog, AvatarSkinColorCatalog
-from apps.base.views import StandardPagination
 from apps.blog.models import Notification
-from .models import CoinLedgerEntry, CoinPackage, CoinPurchase, CoinSpend
-from .serializers import CoinPackageSerializer, LedgerEntrySerializer
-from .tasks import send_coin_purchase_email
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from .models import CoinLedgerEntry, CoinPackage, CoinPurchase
+from .payments import PaymentError, get_checkout_client
+from .serializers import CartCheckoutSerializer, LedgerEntrySerializer
+from .services import (
+    AlreadyOwned,
+    CatalogItemNotFound,
+    InsufficientCoins,
+    get_coin_packages,
+    record_stripe_event,
+    spend_coins,
+)
+from .tasks import process_stripe_events
 
 
 class CoinPackageListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        packages = CoinPackage.objects.filter(is_active=True).order_by("price_cents")
-        serializer = CoinPackageSerializer(packages, many=True)
-        return Response(serializer.data)
+        return Response(get_coin_packages())
 
 
 class CreateCheckoutSessionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, package_id):
-        try:
-            package = CoinPackage.objects.get(id=package_id, is_active=True)
-        except CoinPackage.DoesNotExist:
+        # Read from the database, not the package list cache, so the price charged is always current.
+        package = CoinPackage.objects.filter(id=package_id, is_active=True).first()
+        if package is None:
             return Response({"detail": "Package not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        purchase = CoinPurchase.objects.create(
+        # The id is chosen up front so the purchase is written once, with the session id, after Stripe answers.
+        purchase = CoinPurchase(
+            id=uuid.uuid4(),
             user=request.user,
             package=package,
             coins=package.coins,
@@ -47,7 +53,7 @@ class CreateCheckoutSessionView(APIView):
         )
 
         try:
-            session = stripe.checkout.Session.create(
+            session = get_checkout_client().create_checkout_session(
                 payment_method_types=["card"],
                 line_items=[
                     {
@@ -64,134 +70,90 @@ class CreateCheckoutSessionView(APIView):
                 success_url=request.data.get("success_url", ""),
                 cancel_url=request.data.get("cancel_url", ""),
             )
-        except stripe.error.StripeError as e:
+        except PaymentError as e:
             purchase.status = CoinPurchase.Status.FAILED
-            purchase.save(update_fields=["status"])
+            purchase.save(force_insert=True)
             return Response({"detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 
         purchase.stripe_checkout_session_id = session.id
-        purchase.save(update_fields=["stripe_checkout_session_id"])
+        purchase.save(force_insert=True)
 
         Notification.objects.create(
             user=request.user,
             notification_type=Notification.Type.COIN_PURCHASE_PENDING,
-            metadata={"coins": package.coins, "price_cents": package.price_cents, "currency": package.currency},
+            metadata={
+                "coins": package.coins,
+                "price_cents": package.price_cents,
+                "currency": package.currency,
+            },
         )
 
         return Response({"checkout_url": session.url, "purchase_id": str(purchase.id)})
 
 
+class CartCheckoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartCheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = [(item["target_type"], item["catalog_item_id"]) for item in serializer.validated_data["items"]]
+
+        try:
+            unlocked, coin_balance = spend_coins(request.user.pk, cart)
+        except CatalogItemNotFound as exc:
+            missing = [{"target_type": target_type, "catalog_item_id": item_id} for target_type, item_id in exc.args[0]]
+            return Response({"detail": "Item not found.", "items": missing}, status=status.HTTP_404_NOT_FOUND)
+        except AlreadyOwned:
+            return Response({"detail": "Item already owned."}, status=status.HTTP_409_CONFLICT)
+        except InsufficientCoins:
+            return Response(
+                {"detail": "Insufficient coins.", "code": "insufficient_coins"},
+                status=status.HTTP_402_PAYMENT_REQUIRED,
+            )
+
+        bought = dict.fromkeys(cart)
+        unlocks = [
+            {"target_type": target_type, "catalog_item_id": item_id, "unlocked_id": unlock.id}
+            for (target_type, item_id), unlock in zip(bought, unlocked)
+        ]
+        return Response({"unlocks": unlocks, "coin_balance": coin_balance}, status=status.HTTP_201_CREATED)
+
+
+class LedgerPagination(CursorPagination):
+    page_size = 20
+    ordering = ("-created_at", "-id")
+
+
 class CoinLedgerHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        qs = CoinLedgerEntry.objects.filter(user=request.user).order_by("-created_at")
-        paginator = StandardPagination()
-        entries = paginator.paginate_queryset(qs, request, view=self)
-
-        purchase_ids = set()
-        spend_ids = set()
-        for entry in entries:
-            if entry.reference_id.startswith("purchase:"):
-                purchase_ids.add(entry.reference_id.split(":", 1)[1])
-            elif entry.reference_id.startswith("spend:"):
-                try:
-                    spend_ids.add(int(entry.reference_id.split(":", 1)[1]))
-                except ValueError:
-                    pass
-
-        avatar_item_ids = set()
-        item_color_ids = set()
-        skin_color_ids = set()
-
-        purchases = {str(p.id): p for p in CoinPurchase.objects.filter(id__in=purchase_ids).select_related("package")}
-        spends = {s.id: s for s in CoinSpend.objects.filter(id__in=spend_ids)}
-
-        for spend in spends.values():
-            if spend.reason == CoinSpend.Reason.BUY_ITEM and spend.target_type == "avatar_item":
-                avatar_item_ids.add(int(spend.target_id))
-            elif spend.reason == CoinSpend.Reason.BUY_COLOR:
-                if spend.target_type == "item_color":
-                    item_color_ids.add(int(spend.target_id))
-                elif spend.target_type == "skin_color":
-                    skin_color_ids.add(int(spend.target_id))
-
-        avatar_items = {i.id: i for i in AvatarItemCatalog.objects.filter(id__in=avatar_item_ids)}
-        item_colors = {c.id: c for c in AvatarColorCatalog.objects.filter(id__in=item_color_ids)}
-        skin_colors = {c.id: c for c in AvatarSkinColorCatalog.objects.filter(id__in=skin_color_ids)}
-
-        serializer = LedgerEntrySerializer(
-            entries,
-            many=True,
-            context={
-                "purchases": purchases,
-                "spends": spends,
-                "avatar_items": avatar_items,
-                "item_colors": item_colors,
-                "skin_colors": skin_colors,
-            },
+        qs = CoinLedgerEntry.objects.filter(user=request.user).only(
+            "id", "entry_type", "amount", "created_at", "reference_id", "detail"
         )
+        paginator = LedgerPagination()
+        entries = paginator.paginate_queryset(qs, request, view=self)
+        serializer = LedgerEntrySerializer(entries, many=True)
         return paginator.get_paginated_response(serializer.data)
 
 
 @csrf_exempt
 def stripe_webhook(request):
+    """
+    Verify the event and store it; process_stripe_events applies it after the response, so
+    retries and bursts cost one INSERT each.
+    """
     from django.http import HttpResponse
-    from apps.users.models import CustomUser
 
     payload = request.body
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE", "")
 
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, settings.STRIPE_WEBHOOK_SECRET)
+        stripe.Webhook.construct_event(payload, sig_header, settings.STRIPE_WEBHOOK_SECRET)
     except (ValueError, stripe.error.SignatureVerificationError):
         return HttpResponse(status=400)
 
-    if event["type"] == "checkout.session.completed":
-        session = event.to_dict()["data"]["object"]
-        purchase_id = session.get("metadata", {}).get("purchase_id")
-
-        if not purchase_id:
-            return HttpResponse(status=400)
-
-        idempotency_key = f"purchase:{purchase_id}"
-
-        with transaction.atomic():
-            try:
-                purchase = CoinPurchase.objects.select_related("user").select_for_update().get(id=purchase_id)
-            except CoinPurchase.DoesNotExist:
-                return HttpResponse(status=404)
-
-            if purchase.status == CoinPurchase.Status.PAID:
-                return HttpResponse(status=200)
-
-            purchase.status = CoinPurchase.Status.PAID
-            purchase.paid_at = timezone.now()
-            purchase.stripe_payment_intent_id = session.get("payment_intent")
-            purchase.save(update_fields=["status", "paid_at", "stripe_payment_intent_id"])
-
-            CoinLedgerEntry.objects.get_or_create(
-                idempotency_key=idempotency_key,
-                defaults={
-                    "user": purchase.user,
-                    "entry_type": CoinLedgerEntry.Type.CREDIT,
-                    "amount": purchase.coins,
-                    "reference_id": f"purchase:{purchase_id}",
-                },
-            )
-
-            CustomUser.objects.filter(pk=purchase.user_id).update(coin_balance=F("coin_balance") + purchase.coins)
-
-            Notification.objects.create(
-                user=purchase.user,
-                notification_type=Notification.Type.COIN_PURCHASE_SUCCESS,
-                metadata={"coins": purchase.coins, "price_cents": purchase.price_cents, "currency": purchase.currency},
-            )
-
-            transaction.on_commit(
-                lambda: send_coin_purchase_email.delay(
-                    purchase.user_id, purchase.coins, purchase.price_cents, purchase.currency
-                )
-            )
-
+    record_stripe_event(payload)
+    transaction.on_commit(process_stripe_events.delay)
     return HttpResponse(status=200)
@@ -9,12 +9,32 @@ app = Celery('xloserver')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-app.autodiscover_tasks(['apps.blog', 'apps.base', 'apps.users', 'apps.wallet', 'apps.attempts'])
+app.autodiscover_tasks(['apps.blog', 'apps.base', 'apps.users', 'apps.wallet', 'apps.attempts', 'apps.avatar'])
 
 app.conf.beat_schedule = {
     'send_weekly_recall_email_9am': {
         'task': 'apps.blog.tasks.send_weekly_recall_email',
         'schedule': crontab(hour=9, minute=0, day_of_week=1),
     },
+    'refresh_platform_stats_every_5m': {
+        'task': 'apps.base.tasks.refresh_platform_stats',
+        'schedule': 60 * 5,
+    },
+    'reconcile_coin_balances_daily': {
+        'task': 'apps.wallet.tasks.reconcile_coin_balances',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'process_stripe_events_every_minute': {
+        'task': 'apps.wallet.tasks.process_stripe_events',
+        'schedule': 60.0,
+    },
+    'sweep_expired_attempts_every_30s': {
+        'task': 'apps.attempts.tasks.sweep_expired_attempts',
+        'schedule': 30.0,
+    },
+    'prune_avatar_renders_daily': {
+        'task': 'apps.avatar.tasks.prune_avatar_renders',
+        'schedule': crontab(hour=4, minute=0),
+    },
 
 }
@@ -51,6 +51,8 @@ ALLOWED_HOSTS = ["api.mixelo.io", "15.237.210.201", "localhost", "127.0.0.1"]
 # Stripe
 STRIPE_SECRET_KEY = get_secret("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = get_secret("STRIPE_WEBHOOK_SECRET")
+# "apps.wallet.payments.FakeCheckoutClient" creates checkout sessions without calling Stripe.
+WALLET_CHECKOUT_CLIENT = "apps.wallet.payments.StripeCheckoutClient"
 
 # Google OAuth
 GOOGLE_OAUTH_CLIENT_ID = get_secret("GOOGLE_OAUTH_CLIENT_ID")
@@ -128,9 +130,11 @@ DATABASES = {
     }
 }
 
+# Shared by every web and Celery process, so cache invalidations reach all of them.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://localhost:6379/1",
     }
 }
 
@@ -214,6 +218,10 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
 
+# Platform stats served by /attempts/global_stats/, refreshed by the refresh_platform_stats beat task
+PLATFORM_STATS_CACHE_TIMEOUT = 60 * 10
+PLATFORM_STATS_ESTIMATE_COUNTS = False  # use pg_class.reltuples for unfiltered totals on very large tables
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,